@@ -0,0 +1,146 @@
+"""Micro-benchmarks for the solar predictor and energy model hot paths.
+
+Builds synthetic installation datasets of increasing size by resampling
+stocks/solar_installation_analysis_monthly.csv (with jittered energy values
+so rows are not duplicates), then times each hot path and measures its peak
+traced memory. Timing and memory are taken in separate runs because
+tracemalloc slows allocation-heavy code down.
+
+Run from Backend/:
+
+    python -m benchmarks.hotpaths --sizes 250,10000,100000,1000000 --output hotpaths.json
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, List
+import numpy as np
+import pandas as pd
+from controllers.recommendationController import load_stockpred, solar_data_path
+from controllers.iotpred import predict_consumption, predict_consumption_batch
+from .loadtest import git_commit
+
+MONTH_COLUMNS = [f"Month_{i}_Energy_kWh" for i in range(1, 13)]
+ENERGY_COLUMNS = ["Theoretical_Daily_Energy_kWh", "Average_Daily_Energy_kWh", "Total_Annual_Energy_kWh"] + MONTH_COLUMNS
+
+def synthetic_installations(rows: int, seed: int = 0) -> pd.DataFrame:
+    """``rows`` installations shaped like the bundled dataset"""
+    base = pd.read_csv(solar_data_path)
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), rows)].reset_index(drop=True)
+    # Scale each row's energy consistently so annual still equals the sum of months
+    df[ENERGY_COLUMNS] = df[ENERGY_COLUMNS].to_numpy() * rng.uniform(0.9, 1.1, (rows, 1))
+    return df
+
+def synthetic_devices(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "rooms": rng.integers(1, 7, rows),
+        "bulbs": rng.integers(1, 21, rows),
+        "fans": rng.integers(0, 9, rows),
+        "ovens": rng.integers(0, 3, rows),
+        "washing_machines": rng.integers(0, 3, rows),
+        "acs": rng.integers(0, 5, rows)
+    })
+
+def measure(name: str, rows: int, fn: Callable, repeats: int) -> dict:
+    """Best and mean wall time over ``repeats`` calls, then peak traced memory of one more"""
+    fn()  # warm-up
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = np.array(times) * 1000
+    result = {
+        "benchmark": name,
+        "rows": rows,
+        "repeats": repeats,
+        "min_ms": float(times.min()),
+        "mean_ms": float(times.mean()),
+        "peak_mb": peak / 2**20
+    }
+    print(f"{name:28s} {rows:>9,d} rows  min {result['min_ms']:10.3f} ms  mean {result['mean_ms']:10.3f} ms  peak {result['peak_mb']:9.2f} MB")
+    return result
+
+def repeats_for(rows: int, base: int) -> int:
+    # Fewer repeats for the big sizes so a full run stays in minutes
+    return max(1, base if rows <= 10_000 else base // 10)
+
+def run_size(stockpred, rows: int, workdir: str, repeats: int) -> List[dict]:
+    csv_path = os.path.join(workdir, f"installations_{rows}.csv")
+    synthetic_installations(rows).to_csv(csv_path, index=False)
+    cache_dir = os.path.join(workdir, "cache")
+    slow_repeats = repeats_for(rows, 3)
+    results = [
+        measure("load_data", rows, lambda: stockpred.SolarPredictor(csv_path, use_cache=False), slow_repeats),
+        measure("load_data_streaming", rows, lambda: stockpred.StreamingSolarPredictor(csv_path), slow_repeats)
+    ]
+    # The first construction writes the feature cache; later ones map it
+    stockpred.SolarPredictor(csv_path, cache_dir=cache_dir)
+    results.append(measure("load_data_cached", rows, lambda: stockpred.SolarPredictor(csv_path, cache_dir=cache_dir), slow_repeats))
+
+    predictor = stockpred.SolarPredictor(csv_path, cache_dir=cache_dir)
+    # Keep the result cache out of the way so every call does the work
+    predictor.result_cache_size = 0
+    consumptions = iter(np.random.default_rng(1).uniform(50, 2000, 1_000_000).tolist())
+    project = predictor.projects_df.iloc[0].to_dict()
+    fast_repeats = repeats_for(rows, repeats)
+    results.extend([
+        measure("predict_and_analyze", rows, lambda: predictor.predict_and_analyze(next(consumptions)), fast_repeats),
+        measure("predict_top_k", rows, lambda: predictor.predict_top_k(next(consumptions), 10), fast_repeats),
+        measure("calculate_optimal_shares", rows, lambda: predictor.calculate_optimal_shares(project, 3600.0), repeats),
+    ])
+
+    devices = synthetic_devices(rows)
+    results.append(measure("predict_consumption_batch", rows, lambda: predict_consumption_batch(devices), slow_repeats))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SolarPredictor and energy model hot paths")
+    parser.add_argument("--sizes", default="250,10000,100000,1000000",
+                        help="Comma-separated synthetic dataset sizes")
+    parser.add_argument("--repeats", type=int, default=50, help="Calls per fast benchmark at small sizes")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    stockpred = load_stockpred()
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = [measure("predict_consumption", 1, lambda: predict_consumption(3, 5, 2, 1, 1, 1), args.repeats)]
+    workdir = tempfile.mkdtemp(prefix="solar-bench-")
+    try:
+        for rows in sizes:
+            results.extend(run_size(stockpred, rows, workdir, args.repeats))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "sizes": sizes,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Load test the API in-process against an in-memory Mongo stand-in.
+
+Seeds users and projects into mongomock-motor, drives a weighted mix of
+requests through the real FastAPI app with a fixed number of concurrent
+clients, then checks that no project was oversold and that balances add up
+to what the successful trades and deposits say they should, and that the
+trade journal rebuilds every user's balance and holdings. A share of trades is
+resent with the same Idempotency-Key, and those retries must replay the
+original result without moving money again. Finally a fields= page of the
+project counters trades write must match the stored documents.
+
+Run from Backend/ (needs requirements-bench.txt):
+
+    python -m benchmarks.loadtest --requests 5000 --concurrency 64 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+
+LOCATIONS = ["Gujarat", "Delhi", "Rajasthan", "Kolkata", "Hyderabad", "Chennai", "Mumbai"]
+
+DEFAULT_MIX = {
+    "get_all_projects": 30,
+    "get_projects_by_location": 20,
+    "buy_share": 20,
+    "sell_share": 10,
+    "add_funds": 10,
+    "init_devices": 10
+}
+
+def parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name.strip()}'")
+        mix[name.strip()] = int(weight)
+    return mix
+
+def make_project(i: int, rng: random.Random) -> dict:
+    price = round(rng.uniform(500, 5000), 2)
+    return {
+        "project_id": f"P{i:05d}",
+        "project_company": f"Company {i % 17}",
+        "project_location": LOCATIONS[i % len(LOCATIONS)],
+        "project_size": rng.uniform(1, 50),
+        "installed_capacity": rng.uniform(1, 50),
+        "operational_capacity": rng.uniform(1, 50),
+        "project_cost": rng.uniform(10, 500),
+        "project_status": "operational",
+        "project_subscription_cost": price,
+        "expected_roi": round(rng.uniform(4, 18), 2),
+        "sunlight_hours_per_day": rng.uniform(4, 7),
+        "maintenance_cost": rng.uniform(0.1, 5),
+        "annual_carbon_offset": rng.uniform(100, 5000),
+        "peak_efficiency": rng.uniform(15, 23),
+        "degradation_rate": rng.uniform(0.3, 0.8),
+        "estimated_output": rng.uniform(1000, 90000),
+        "estimated_returns_per_share": price * 0.1,
+        "earnings_per_share": round(price * rng.uniform(0.01, 0.05), 2),
+        "subscribers_accepted": 0,
+        "active_subscribers": 0,
+        "available_shares": rng.randint(50, 500)
+    }
+
+def make_user(i: int, rng: random.Random) -> dict:
+    return {
+        "phone_number": 9000000000 + i,
+        "energy_consumption": rng.uniform(100, 900),
+        "active_stocks": [],
+        "balance": round(rng.uniform(10000, 200000), 2)
+    }
+
+
+class LoadTest:
+    def __init__(self, client, users: List[dict], projects: List[dict], mix: Dict[str, int], seed: int, retry_rate: float = 0.0):
+        self.client = client
+        self.retry_rate = retry_rate
+        self.replays = 0
+        self.replay_mismatches = 0
+        self.users = users
+        self.projects = projects
+        self.prices = {p["project_id"]: p["project_subscription_cost"] for p in projects}
+        self.earnings_per_share = {p["project_id"]: p["earnings_per_share"] for p in projects}
+        self.rng = random.Random(seed)
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.owned: Dict[int, set] = defaultdict(set)
+        # Money moved by successful requests, for the balance invariant
+        self.deposited = 0.0
+        self.spent = 0.0
+        self.credited = 0.0
+
+    async def _trade(self, path: str, params: dict):
+        """POST a trade with an Idempotency-Key, sometimes resending it like a client retry"""
+        headers = {"Idempotency-Key": uuid.UUID(int=self.rng.getrandbits(128)).hex}
+        response = await self.client.post(path, params=params, headers=headers)
+        if self.rng.random() < self.retry_rate:
+            retry = await self.client.post(path, params=params, headers=headers)
+            self.replays += 1
+            if retry.status_code == 200 and response.status_code == 200 and retry.json() != response.json():
+                self.replay_mismatches += 1
+        return response
+
+    async def get_all_projects(self):
+        return await self.client.get("/get-all-projects")
+
+    async def get_projects_by_location(self):
+        return await self.client.get("/get-projects-by-location", params={"location": self.rng.choice(LOCATIONS)})
+
+    async def buy_share(self):
+        phone = self.rng.choice(self.users)["phone_number"]
+        project_id = self.rng.choice(self.projects)["project_id"]
+        amount = self.rng.randint(1, 5)
+        response = await self._trade("/buy-share", {"phone_num": phone, "share_id": project_id, "amount": amount})
+        if response.status_code == 200 and response.json().get("message") == "Shares purchased successfully":
+            self.spent += self.prices[project_id] * amount
+            self.owned[phone].add(project_id)
+        return response
+
+    async def sell_share(self):
+        owners = [phone for phone, projects in self.owned.items() if projects]
+        if not owners:
+            return await self.buy_share()
+        phone = self.rng.choice(owners)
+        project_id = self.rng.choice(sorted(self.owned[phone]))
+        amount = self.rng.randint(1, 3)
+        response = await self._trade("/sell-share", {"phone_num": phone, "share_id": project_id, "amount": amount})
+        body = response.json() if response.status_code == 200 else {}
+        if body.get("message") == "Shares sold successfully":
+            self.credited += body["earnings_from_sale"] + self.earnings_per_share[project_id] * amount
+        elif body.get("message") == "User does not own shares of this project":
+            self.owned[phone].discard(project_id)
+        return response
+
+    async def add_funds(self):
+        phone = self.rng.choice(self.users)["phone_number"]
+        amount = round(self.rng.uniform(100, 5000), 2)
+        response = await self._trade("/add-funds", {"phone_num": phone, "amount": amount})
+        if response.status_code == 200 and response.json().get("message") == "Funds added successfully":
+            self.deposited += amount
+        return response
+
+    async def init_devices(self):
+        return await self.client.post("/init-devices", params={
+            "rooms": self.rng.randint(1, 6), "bulbs": self.rng.randint(1, 20), "fans": self.rng.randint(0, 8),
+            "ovens": self.rng.randint(0, 2), "washing_machines": self.rng.randint(0, 2), "acs": self.rng.randint(0, 4)
+        })
+
+    async def _worker(self, remaining: List[int]):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await getattr(self, operation)()
+                failed = response.status_code >= 400
+            except Exception as e:
+                print(f"Error running {operation}: {e}")
+                failed = True
+            self.latencies[operation].append(time.perf_counter() - start)
+            if failed:
+                self.errors[operation] += 1
+
+    async def run(self, requests: int, concurrency: int) -> float:
+        remaining = [requests]
+        start = time.perf_counter()
+        await asyncio.gather(*(self._worker(remaining) for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        for operation, latencies in sorted(self.latencies.items()):
+            ms = np.array(latencies) * 1000
+            operations[operation] = {
+                "requests": len(latencies),
+                "errors": self.errors[operation],
+                "throughput_rps": len(latencies) / elapsed,
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max())
+            }
+        all_ms = np.concatenate([np.array(latencies) for latencies in self.latencies.values()]) * 1000
+        return {
+            "elapsed_s": elapsed,
+            "requests": len(all_ms),
+            "throughput_rps": len(all_ms) / elapsed,
+            "p50_ms": float(np.percentile(all_ms, 50)),
+            "p95_ms": float(np.percentile(all_ms, 95)),
+            "p99_ms": float(np.percentile(all_ms, 99)),
+            "replayed_retries": self.replays,
+            "operations": operations
+        }
+
+
+async def ledger_mismatches(db, tolerance: float = 1e-6) -> List[int]:
+    """Users whose journal-derived position differs from their balance or holdings"""
+    from controllers.tradeLedger import getLedgerPosition
+
+    holdings = defaultdict(dict)
+    async for holding in db.users.get_collection("holdings").find({}, {"phone_number": 1, "project_id": 1, "num_shares": 1}):
+        if holding["num_shares"]:
+            holdings[holding["phone_number"]][holding["project_id"]] = holding["num_shares"]
+
+    mismatched = []
+    async for user in db.users.get_collection("users").find({}, {"phone_number": 1, "balance": 1}):
+        position = await getLedgerPosition(user["phone_number"])
+        if (abs(position["balance"] - user["balance"]) > tolerance * max(1.0, abs(user["balance"]))
+                or position["holdings"] != holdings[user["phone_number"]]):
+            mismatched.append(user["phone_number"])
+    return mismatched
+
+# Project counters the trade paths write; a fields= page must be able to return them
+TRADE_COUNTERS = ["available_shares", "subscribers_accepted", "active_subscribers"]
+
+async def page_mismatches(client, db) -> List[str]:
+    """Projects whose fields= page disagrees with the stored trade counters"""
+    project_collection = db.projects.get_collection("projectDetails")
+    stored = {
+        project["project_id"]: project
+        async for project in project_collection.find({}, {"_id": 0, "project_id": 1, **{field: 1 for field in TRADE_COUNTERS}})
+    }
+    mismatched, after = [], None
+    while True:
+        params = {"fields": ",".join(TRADE_COUNTERS), "limit": 200}
+        if after:
+            params["after"] = after
+        response = await client.get("/get-all-projects", params=params)
+        if response.status_code != 200:
+            return [f"HTTP {response.status_code}: {response.text}"]
+        page = response.json()
+        for project in page["projects"]:
+            expected = stored.pop(project["project_id"], None)
+            if expected is None or any(project.get(field) != expected.get(field) for field in TRADE_COUNTERS):
+                mismatched.append(project["project_id"])
+        after = page["next_cursor"]
+        if after is None:
+            break
+    return mismatched + sorted(stored)
+
+async def check_invariants(db, projects: List[dict], initial_balance: float, test: LoadTest, page_mismatched: List[str]) -> dict:
+    """Shares are conserved per project, balances match the successful requests and the journal"""
+    users_collection = db.users.get_collection("users")
+    holdings_collection = db.users.get_collection("holdings")
+    project_collection = db.projects.get_collection("projectDetails")
+
+    held = defaultdict(int)
+    negative_holdings = 0
+    async for holding in holdings_collection.find({}, {"project_id": 1, "num_shares": 1}):
+        held[holding["project_id"]] += holding["num_shares"]
+        negative_holdings += holding["num_shares"] < 0
+
+    oversold, shares_not_conserved = [], []
+    initial_shares = {p["project_id"]: p["available_shares"] for p in projects}
+    async for project in project_collection.find({}, {"project_id": 1, "available_shares": 1}):
+        if project["available_shares"] < 0:
+            oversold.append(project["project_id"])
+        if project["available_shares"] + held[project["project_id"]] != initial_shares[project["project_id"]]:
+            shares_not_conserved.append(project["project_id"])
+
+    final_balance, negative_balances = 0.0, 0
+    async for user in users_collection.find({}, {"balance": 1}):
+        final_balance += user["balance"]
+        negative_balances += user["balance"] < 0
+    expected_balance = initial_balance + test.deposited - test.spent + test.credited
+    balance_error = final_balance - expected_balance
+    ledger_mismatched = await ledger_mismatches(db)
+
+    return {
+        "oversold_projects": oversold,
+        "shares_not_conserved": shares_not_conserved,
+        "negative_holdings": negative_holdings,
+        "negative_balances": negative_balances,
+        "expected_total_balance": expected_balance,
+        "final_total_balance": final_balance,
+        "balance_error": balance_error,
+        "ledger_mismatches": ledger_mismatched,
+        "replay_mismatches": test.replay_mismatches,
+        "page_mismatches": page_mismatched,
+        "passed": not oversold and not shares_not_conserved and not negative_holdings and not negative_balances
+                  and not ledger_mismatched and not test.replay_mismatches and not page_mismatched and abs(balance_error) <= 1e-6 * max(1.0, abs(expected_balance))
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def run_benchmark(args) -> dict:
+    import httpx
+    from mongomock_motor import AsyncMongoMockClient
+    import controllers.databaseController as databaseController
+    from controllers.tradeLedger import open_ledger_accounts
+
+    # connect_to_database() keeps an existing client, so the app runs on the stand-in
+    os.environ.setdefault("MONGO", "mongodb://localhost")
+    databaseController.client = AsyncMongoMockClient()
+    db = databaseController.client
+    import main
+
+    rng = random.Random(args.seed)
+    projects = [make_project(i, rng) for i in range(args.projects)]
+    users = [make_user(i, rng) for i in range(args.users)]
+    await db.projects.get_collection("projectDetails").insert_many([dict(p) for p in projects])
+    await db.users.get_collection("users").insert_many([dict(u) for u in users])
+    initial_balance = sum(u["balance"] for u in users)
+    await open_ledger_accounts()
+
+    await main.startup_event()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            test = LoadTest(client, users, projects, args.mix, args.seed, args.retry_rate)
+            elapsed = await test.run(args.requests, args.concurrency)
+            # Let any order batch still in its window settle before checking
+            await asyncio.sleep(0.1)
+            page_mismatched = await page_mismatches(client, db)
+        invariants = await check_invariants(db, projects, initial_balance, test, page_mismatched)
+    finally:
+        await main.shutdown_event()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "config": {
+            "users": args.users,
+            "projects": args.projects,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "retry_rate": args.retry_rate,
+            "mix": args.mix
+        },
+        "results": test.report(elapsed),
+        "invariants": invariants
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API against an in-memory Mongo stand-in")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Operation weights, e.g. buy_share=50,sell_share=50")
+    parser.add_argument("--retry-rate", type=float, default=0.1,
+                        help="Fraction of trades resent with the same Idempotency-Key")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run_benchmark(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+    # A broken invariant fails the run so CI can catch it
+    return 0 if results["invariants"]["passed"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
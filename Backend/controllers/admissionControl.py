@@ -0,0 +1,217 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from .databaseController import get_rate_limits_collection, normalize_phone
+from .metrics import requests_shed
+from .idempotency import idempotency_cache, cache_key
+
+# Admission control for the expensive routes. Each limited route admits a
+# fixed number of requests at a time and lets a bounded number wait briefly
+# for a slot; anything beyond that is turned away at once with a 503, so a
+# burst of trades cannot pile up Mongo operations and slow every other route.
+# Trades are also rate limited per phone number with a token bucket (429).
+#
+# Concurrency limits are per app worker. Rate limit buckets are in memory by
+# default; RATE_LIMIT_BACKEND=mongo shares them between workers.
+
+# route name -> (max in flight, max waiting); override with
+# ADMISSION_LIMITS="buy-share=64/256,recommend-project=8/32"
+DEFAULT_ROUTE_LIMITS = {
+    "buy-share": (64, 256),
+    "sell-share": (64, 256),
+    "add-funds": (32, 128),
+    "recommend-project": (16, 64),
+    "init-devices-batch": (4, 8),
+}
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", 2000)) / 1000
+
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", 5))  # tokens per second; 0 disables
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 20))
+
+def route_limits() -> Dict[str, Tuple[int, int]]:
+    limits = dict(DEFAULT_ROUTE_LIMITS)
+    for part in filter(None, os.getenv("ADMISSION_LIMITS", "").split(",")):
+        try:
+            name, _, values = part.partition("=")
+            max_in_flight, _, max_waiting = values.partition("/")
+            limits[name.strip()] = (int(max_in_flight), int(max_waiting or 0))
+        except ValueError:
+            raise ValueError(f"Invalid ADMISSION_LIMITS entry: {part!r}")
+    return limits
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class RouteLimiter:
+    """Admits ``max_in_flight`` requests at once, with at most ``max_waiting`` queued"""
+
+    def __init__(self, name: str, max_in_flight: int, max_waiting: int, timeout: float = QUEUE_TIMEOUT):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _shed(self, reason: str, detail: str):
+        requests_shed.inc(self.name, reason)
+        raise HTTPException(status_code=503, detail=detail, headers=_retry_after(self.timeout))
+
+    async def acquire(self):
+        if self.semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self._shed("queue_full", "Server busy, please retry")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self._shed("queue_timeout", "Server busy, please retry")
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_waiting": self.max_waiting
+        }
+
+
+class MemoryRateLimitBackend:
+    """Token buckets in this process, least recently used ones dropped past ``max_keys``"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take ``cost`` tokens; returns (allowed, seconds until enough tokens)"""
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            # A dropped bucket starts full again, which only errs on the lenient side
+            self.buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+class MongoRateLimitBackend:
+    """Token buckets shared by every worker, one document per key.
+
+    Refill and take happen in one pipeline update against the server clock,
+    so concurrent workers cannot both spend the last token. Idle buckets
+    expire through the TTL index on ``expires``.
+    """
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated", "$$NOW"]}]}, 1000]}
+        refilled = {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [{"$max": [elapsed, 0]}, rate]}]}]}
+        idle_ms = int((burst / rate + 60) * 1000)
+        collection = await get_rate_limits_collection()
+        bucket = await collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": "$$NOW"}},
+                {"$set": {"allowed": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "expires": {"$add": ["$$NOW", idle_ms]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (cost - bucket["tokens"]) / rate
+
+
+RATE_LIMIT_BACKENDS = {"memory": MemoryRateLimitBackend, "mongo": MongoRateLimitBackend}
+
+class RateLimiter:
+    """Per-key token bucket: ``rate`` tokens a second, up to ``burst`` saved up"""
+
+    def __init__(self, rate: float, burst: float, backend=None):
+        self.rate = rate
+        self.burst = burst
+        self.backend = backend or MemoryRateLimitBackend()
+
+    async def check(self, key: str, route: str):
+        if self.rate <= 0:
+            return
+        try:
+            allowed, retry_after = await self.backend.take(key, self.rate, self.burst)
+        except PyMongoError as e:
+            # A shared backend that is down should not take trading down with it
+            print(f"Error checking rate limit, allowing request: {e}")
+            return
+        if not allowed:
+            requests_shed.inc(route, "rate_limited")
+            raise HTTPException(status_code=429, detail="Too many requests, please slow down", headers=_retry_after(retry_after))
+
+
+def _rate_limit_backend():
+    name = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if name not in RATE_LIMIT_BACKENDS:
+        raise ValueError(f"Invalid RATE_LIMIT_BACKEND: {name!r}")
+    return RATE_LIMIT_BACKENDS[name]()
+
+limiters = {name: RouteLimiter(name, *limits) for name, limits in route_limits().items()}
+rate_limiter = RateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST, _rate_limit_backend())
+
+def set_rate_limit_backend(backend):
+    """Swap in another shared store; anything with an async ``take`` like the backends above"""
+    rate_limiter.backend = backend
+
+def admission_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def admit(route: str, rate_limited: bool = False):
+    """Route dependency that holds a concurrency slot for the request.
+
+    With ``rate_limited`` the caller's ``phone_num`` is also charged a token,
+    before a slot is taken so throttled callers never occupy one. Retries of
+    an Idempotency-Key this worker already holds skip both: they only wait
+    for or replay the stored result.
+    """
+    limiter = limiters.get(route)
+
+    async def dependency(request: Request):
+        phone_num = request.query_params.get("phone_num")
+        key = request.headers.get("Idempotency-Key")
+        if phone_num is not None and key and idempotency_cache.known(cache_key(route, normalize_phone(phone_num), key)):
+            yield
+            return
+        if rate_limited and phone_num is not None:
+            await rate_limiter.check(str(normalize_phone(phone_num)), route)
+        if limiter is None:
+            yield
+            return
+        await limiter.acquire()
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    return dependency
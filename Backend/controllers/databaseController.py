@@ -1,13 +1,77 @@
+import asyncio
 import os
+import time
 import dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from pymongo.errors import PyMongoError
 from typing import Optional
+from contextlib import asynccontextmanager
 from fastapi import HTTPException
+from .metrics import MongoCommandTimer, pool_monitor
 
 dotenv.load_dotenv()
 
 client: Optional[AsyncIOMotorClient] = None
 
+# Environment variable -> (MongoClient option, type); unset ones keep the driver default
+CLIENT_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),  # e.g. "zstd,snappy,zlib"
+}
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+def client_options() -> dict:
+    options = {}
+    for variable, (option, parse) in CLIENT_SETTINGS.items():
+        value = os.getenv(variable)
+        if value:
+            try:
+                options[option] = parse(value)
+            except ValueError:
+                raise ValueError(f"Invalid value for {variable}: {value!r}")
+    return options
+
+def catalog_read_preference():
+    """Project catalog reads may go to secondaries; trades always read the primary"""
+    name = os.getenv("MONGO_CATALOG_READ_PREFERENCE", "primaryPreferred")
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Invalid MONGO_CATALOG_READ_PREFERENCE: {name!r}")
+    return READ_PREFERENCES[name]
+
+# Outcome of the most recent ping, so startup steps can skip work that would
+# only wait out the server selection timeout
+last_ping_ok = False
+
+async def ping_database(timeout: float = 5.0) -> float:
+    """Round-trip a ping to the server; returns the latency in seconds"""
+    global last_ping_ok
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+    except Exception:
+        last_ping_ok = False
+        raise
+    last_ping_ok = True
+    return time.perf_counter() - start
+
+def database_reachable() -> bool:
+    """Whether the most recent ping succeeded"""
+    return last_ping_ok
+
 async def connect_to_database():
     global client
     if client is None:
@@ -15,12 +79,21 @@ async def connect_to_database():
             mongo_uri = os.getenv("MONGO")
             if not mongo_uri:
                 raise ValueError("MongoDB URI not found in environment variables.")
-            client = AsyncIOMotorClient(mongo_uri)
+            # Every command is timed for /metrics and the per-request Server-Timing,
+            # and pool events feed the saturation numbers on /health
+            client = AsyncIOMotorClient(mongo_uri, event_listeners=[MongoCommandTimer(), pool_monitor], **client_options())
             print("Connected to MongoDB")
         except Exception as e:
             print(f"Error connecting to MongoDB: {e}")
             raise HTTPException(status_code=500, detail="Database connection error")
 
+    # Readiness check: the client connects lazily, so make one round trip now
+    try:
+        await ping_database()
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        # Keep starting; /health reports unavailable until a ping succeeds
+        print(f"MongoDB is not reachable yet: {e}")
+
 async def close_database_connection():
     global client
     if client is not None:
@@ -28,14 +101,82 @@ async def close_database_connection():
         client = None
         print("MongoDB connection closed")
 
-async def get_users_collection():
+# Collection handles are resolved once per client and reused
+_handles = {}
+_handles_client = None
+
+def _collection(db_name: str, name: str, read_preference=ReadPreference.PRIMARY):
+    global _handles, _handles_client
     if client is None:
         raise HTTPException(status_code=500, detail="Database connection not established")
-    db = client.users
-    return db.get_collection("users")
+    if _handles_client is not client:
+        _handles, _handles_client = {}, client
+    key = (db_name, name, read_preference.mode)
+    handle = _handles.get(key)
+    if handle is None:
+        handle = _handles[key] = client[db_name].get_collection(name, read_preference=read_preference)
+    return handle
+
+def normalize_phone(phone_number) -> int:
+    """Phone numbers are stored as ints; coerce str input so lookups hit the unique index"""
+    try:
+        return int(str(phone_number).strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid phone number")
+
+async def get_users_collection():
+    return _collection("users", "users")
 
 async def getProjectCollection():
+    return _collection("projects", "projectDetails")
+
+async def get_catalog_collection():
+    """projectDetails for catalog reads, with the configurable read preference"""
+    return _collection("projects", "projectDetails", catalog_read_preference())
+
+async def get_holdings_collection():
+    return _collection("users", "holdings")
+
+async def get_trades_collection():
+    """Append-only journal of balance and share movements"""
+    return _collection("users", "trades")
+
+async def get_snapshots_collection():
+    return _collection("users", "trade_snapshots")
+
+async def get_ledger_state_collection():
+    return _collection("users", "ledger_state")
+
+async def get_idempotency_collection():
+    """Stored results of requests sent with an Idempotency-Key"""
+    return _collection("users", "idempotency_keys")
+
+async def get_rate_limits_collection():
+    """Token buckets shared between app workers when RATE_LIMIT_BACKEND=mongo"""
+    return _collection("users", "rate_limits")
+
+async def database_health() -> dict:
+    """Ping latency and connection pool usage, for /health"""
+    health = {"status": "unavailable", "ping_ms": None, "pool": pool_monitor.stats(client)}
     if client is None:
-        raise HTTPException(status_code=500, detail="Database connection not established")
-    db = client.projects
-    return db.get_collection("projectDetails")
+        return health
+    try:
+        health["ping_ms"] = await ping_database(timeout=2.0) * 1000
+        health["status"] = "ok"
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        print(f"Error pinging MongoDB: {e}")
+    return health
+
+def transactions_enabled() -> bool:
+    """Multi-document transactions need a replica set, so they are opt-in"""
+    return os.getenv("MONGO_TRANSACTIONS", "").lower() in ("1", "true", "yes")
+
+@asynccontextmanager
+async def trade_session():
+    """Yield a session with an open transaction, or None when transactions are disabled"""
+    if client is None or not transactions_enabled():
+        yield None
+        return
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            yield session
@@ -0,0 +1,251 @@
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from .databaseController import (
+    get_users_collection, get_holdings_collection, getProjectCollection,
+    get_trades_collection, get_ledger_state_collection
+)
+from .tradeLedger import LeasedJob, trade_entry
+
+# Pays each holding's share of its project's earnings once per accrual period
+# and refreshes the holding's profit and dividend_yield from the current
+# earnings_per_share. Holdings are streamed in (phone_number, project_id) order
+# so each user's holdings arrive together; a batch of users then costs a few
+# unordered bulk writes instead of an update per holding.
+#
+# Every step is idempotent for a period, so an interrupted run resumes from its
+# checkpoint (the last fully processed phone number) and repeating a batch
+# never pays twice:
+#   1. holdings are marked with the period and the payout they earned,
+#      only if not marked already
+#   2. dividend journal entries carry the period as ``ref`` and a unique index
+#      drops the repeats
+#   3. users are credited for their marked holdings that are not ``credited``
+#      yet. The user document lists the holdings this period's credits
+#      covered and the update is conditional on that list, so a holding is
+#      paid exactly once even if it was marked after its user was credited
+#   4. the paid holdings are flagged ``credited`` with the period
+#
+# Run one period by hand with:  python -m controllers.dividendAccrual
+
+PERIODS_PER_YEAR = {"monthly": 12, "quarterly": 4, "annual": 1}
+ACCRUAL_PERIOD = os.getenv("DIVIDEND_ACCRUAL_PERIOD", "monthly")
+ACCRUAL_BATCH_SIZE = int(os.getenv("DIVIDEND_ACCRUAL_BATCH_SIZE", 1000))
+DUPLICATE_KEY = 11000
+
+def period_key(when: datetime, period: str = ACCRUAL_PERIOD) -> str:
+    """The accrual period containing ``when``, e.g. 2024-07, 2024-Q3 or 2024"""
+    if period not in PERIODS_PER_YEAR:
+        raise ValueError(f"Invalid DIVIDEND_ACCRUAL_PERIOD: {period!r}")
+    if period == "monthly":
+        return f"{when.year}-{when.month:02d}"
+    if period == "quarterly":
+        return f"{when.year}-Q{(when.month - 1) // 3 + 1}"
+    return str(when.year)
+
+
+class _ProjectTerms:
+    """earnings_per_share and share value per project, fetched once per run"""
+
+    def __init__(self):
+        self.projects: Dict[str, Optional[dict]] = {}
+
+    async def load(self, project_ids):
+        missing = [project_id for project_id in set(project_ids) if project_id not in self.projects]
+        if not missing:
+            return
+        project_collection = await getProjectCollection()
+        for project_id in missing:
+            self.projects[project_id] = None  # Deleted projects pay nothing
+        cursor = project_collection.find(
+            {"project_id": {"$in": missing}},
+            {"_id": 0, "project_id": 1, "earnings_per_share": 1, "project_subscription_cost": 1}
+        )
+        async for project in cursor:
+            self.projects[project["project_id"]] = project
+
+    def get(self, project_id: str) -> Optional[dict]:
+        return self.projects.get(project_id)
+
+
+def _holding_accrual(holding: dict, project: dict, period: str, periods_per_year: int) -> UpdateOne:
+    """Refresh a holding's profit from the current earnings and record this period's payout"""
+    num_shares = holding["num_shares"]
+    earnings_per_share = project["earnings_per_share"]
+    annual = earnings_per_share * num_shares
+    payout = annual / periods_per_year
+    share_value = holding.get("current_share_value") or project["project_subscription_cost"]
+    return UpdateOne(
+        {"_id": holding["_id"], "last_accrual": {"$ne": period}},
+        {
+            "$set": {
+                "profit": {"monthly": annual / 12, "quarterly": annual / 4, "annual": annual},
+                "dividend_yield": earnings_per_share / share_value * 100 if share_value else 0.0,
+                "last_accrual": period,
+                "last_dividend": payout
+            },
+            "$inc": {"dividends_paid": payout}
+        }
+    )
+
+
+async def _accrue_batch(holdings: List[dict], terms: _ProjectTerms, period: str, periods_per_year: int):
+    """Pay one batch of users' holdings"""
+    holdings_collection = await get_holdings_collection()
+    user_collection = await get_users_collection()
+    trades_collection = await get_trades_collection()
+
+    await terms.load(holding["project_id"] for holding in holdings)
+    operations = []
+    for holding in holdings:
+        project = terms.get(holding["project_id"])
+        if project is not None and holding["num_shares"] > 0:
+            operations.append(_holding_accrual(holding, project, period, periods_per_year))
+    if operations:
+        await holdings_collection.bulk_write(operations, ordered=False)
+
+    # Pay what the marked holdings recorded, which is also right for holdings
+    # marked by an earlier, interrupted attempt at this batch
+    phones = list({holding["phone_number"] for holding in holdings})
+    payouts = defaultdict(list)
+    cursor = holdings_collection.find(
+        {"phone_number": {"$in": phones}, "last_accrual": period, "last_dividend": {"$gt": 0}, "credited": {"$ne": period}},
+        {"phone_number": 1, "project_id": 1, "last_dividend": 1}
+    )
+    async for holding in cursor:
+        payouts[holding["phone_number"]].append(holding)
+    if not payouts:
+        return
+
+    ts = datetime.utcnow()
+    entries = []
+    for phone_num, paid in payouts.items():
+        for holding in paid:
+            entry = trade_entry("dividend", phone_num, holding["last_dividend"], holding["project_id"], 0, ts=ts)
+            entry["ref"] = period
+            entries.append(entry)
+    try:
+        await trades_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Entries journaled by an earlier attempt at this batch are expected duplicates
+        if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+            raise
+
+    credits = {
+        user["phone_number"]: user.get("dividend_credit")
+        async for user in user_collection.find({"phone_number": {"$in": list(payouts)}}, {"phone_number": 1, "dividend_credit": 1})
+    }
+    operations, covered = [], {}
+    for phone_num, paid in payouts.items():
+        if phone_num not in credits:
+            print(f"Dividends for {phone_num} not credited: user not found")
+            continue
+        record = credits[phone_num]
+        already = record["holdings"] if record and record.get("period") == period else []
+        unpaid = [holding for holding in paid if holding["_id"] not in already]
+        covered[phone_num] = already + [holding["_id"] for holding in unpaid]
+        if unpaid:
+            operations.append(UpdateOne(
+                {"phone_number": phone_num, "dividend_credit": record},
+                {
+                    "$inc": {"balance": sum(holding["last_dividend"] for holding in unpaid)},
+                    "$set": {"dividend_credit": {"period": period, "holdings": covered[phone_num]}}
+                }
+            ))
+    if operations:
+        await user_collection.bulk_write(operations, ordered=False)
+
+    # Flag only what the user documents confirm, so a credit that did not land is retried
+    confirmed = []
+    async for user in user_collection.find({"phone_number": {"$in": list(covered)}}, {"phone_number": 1, "dividend_credit": 1}):
+        record = user.get("dividend_credit") or {}
+        if record.get("period") == period:
+            confirmed.extend(record["holdings"])
+    if confirmed:
+        await holdings_collection.update_many({"_id": {"$in": confirmed}}, {"$set": {"credited": period}})
+    expected = sum(len(holding_ids) for holding_ids in covered.values())
+    if len(confirmed) < expected:
+        raise RuntimeError(f"{expected - len(confirmed)} dividend credits for {period} did not apply")
+
+
+async def accrue_dividends(period: Optional[str] = None, batch_size: int = ACCRUAL_BATCH_SIZE) -> int:
+    """Pay out the current period (or resume an unfinished one).
+
+    An unfinished run always goes first; asking for a different period
+    while one is unfinished raises ValueError. Returns the number of users credited for the period, 0 when it had
+    already been paid before this call.
+    """
+    state_collection = await get_ledger_state_collection()
+    holdings_collection = await get_holdings_collection()
+    periods_per_year = PERIODS_PER_YEAR[ACCRUAL_PERIOD]
+
+    state = await state_collection.find_one({"_id": "dividends"}) or {}
+    if state.get("period") and not state.get("done"):
+        if period is not None and period != state["period"]:
+            raise ValueError(f"Dividend accrual for {state['period']} is unfinished; finish it before accruing {period}")
+        period = state["period"]  # An interrupted run goes first
+    else:
+        period = period or period_key(datetime.utcnow())
+        if state.get("period") == period:
+            return 0
+        state = {"_id": "dividends", "period": period, "after": None, "done": False}
+        await state_collection.replace_one({"_id": "dividends"}, state, upsert=True)
+
+    query = {"num_shares": {"$gt": 0}}
+    if state.get("after") is not None:
+        query["phone_number"] = {"$gt": state["after"]}
+    cursor = holdings_collection.find(
+        query,
+        {"phone_number": 1, "project_id": 1, "num_shares": 1, "current_share_value": 1},
+        batch_size=batch_size
+    ).sort([("phone_number", ASCENDING), ("project_id", ASCENDING)])
+
+    terms = _ProjectTerms()
+    batch, users = [], 0
+
+    async def flush():
+        await _accrue_batch(batch, terms, period, periods_per_year)
+        await state_collection.update_one({"_id": "dividends"}, {"$set": {"after": batch[-1]["phone_number"]}})
+
+    async for holding in cursor:
+        # Batches end on a user boundary so the checkpoint never splits a user
+        if batch and holding["phone_number"] != batch[-1]["phone_number"]:
+            users += 1
+            if users >= batch_size:
+                await flush()
+                batch, users = [], 0
+        batch.append(holding)
+    if batch:
+        await flush()
+
+    await state_collection.update_one({"_id": "dividends"}, {"$set": {"done": True, "finished_at": datetime.utcnow()}})
+    # Counted from the credit records, since a repeated batch cannot tell what it credited before
+    return await (await get_users_collection()).count_documents({"dividend_credit.period": period})
+
+
+# The job wakes up every DIVIDEND_ACCRUAL_CHECK_INTERVAL seconds and pays the
+# period once it has begun; 0 disables it
+accrual_job = LeasedJob("dividends", float(os.getenv("DIVIDEND_ACCRUAL_CHECK_INTERVAL", 3600)), accrue_dividends, "dividend credits")
+
+async def start_accrual_job():
+    accrual_job.start()
+
+async def stop_accrual_job():
+    await accrual_job.stop()
+
+
+if __name__ == "__main__":
+    from .databaseController import connect_to_database, close_database_connection
+
+    async def main():
+        await connect_to_database()
+        try:
+            print(f"Dividends credited to {await accrue_dividends()} users")
+        finally:
+            await close_database_connection()
+
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+from pymongo import ReplaceOne, UpdateOne, ReturnDocument
+from pymongo.errors import PyMongoError
+from .databaseController import get_users_collection, get_holdings_collection
+from models.projectSchema import ProjectHolding
+
+# Holdings live in their own collection, one small document per
+# (phone_number, project_id), so a trade touches one holding instead of
+# rewriting the user's whole active_stocks array.
+
+HOLDING_PROJECTION = {"_id": 0, "phone_number": 0, "last_order_batch": 0, "last_accrual": 0, "credited": 0}
+
+def holding_increments(project: dict, amount: int, investment: float, carbon_offset: float = 0.0) -> dict:
+    """$inc fields that move a holding by ``amount`` shares of ``project``"""
+    earnings_per_share = project["earnings_per_share"]
+    return {
+        "num_shares": amount,
+        "total_investment": investment,
+        "profit.annual": earnings_per_share * amount,
+        "profit.monthly": earnings_per_share * amount / 12,
+        "profit.quarterly": earnings_per_share * amount / 4,
+        "carbon_offset": carbon_offset
+    }
+
+def holding_defaults(project: dict) -> dict:
+    """Fields written only when a buy creates the holding"""
+    return {
+        "share_price": project["project_subscription_cost"],
+        "purchase_date": datetime.utcnow(),
+        "projected_annual_return": project["expected_roi"],
+        "dividend_yield": 0.0,
+        "current_share_value": project["project_subscription_cost"]
+    }
+
+def _add_shares_update(phone_num: int, project: dict, amount: int, total_cost: float, carbon_offset: float):
+    query = {"phone_number": phone_num, "project_id": project["project_id"]}
+    update = {
+        "$inc": holding_increments(project, amount, total_cost, carbon_offset),
+        "$setOnInsert": holding_defaults(project)
+    }
+    return query, update
+
+def add_shares_operation(phone_num: int, project: dict, amount: int, total_cost: float, carbon_offset: float) -> UpdateOne:
+    """Bulk-write upsert that adds shares to a holding, creating it on the first buy"""
+    query, update = _add_shares_update(phone_num, project, amount, total_cost, carbon_offset)
+    return UpdateOne(query, update, upsert=True)
+
+async def find_holding(phone_num: int, project_id: str, session=None) -> Optional[dict]:
+    holdings_collection = await get_holdings_collection()
+    return await holdings_collection.find_one({"phone_number": phone_num, "project_id": project_id}, session=session)
+
+async def list_holdings(phone_num: int) -> List[dict]:
+    holdings_collection = await get_holdings_collection()
+    cursor = holdings_collection.find({"phone_number": phone_num}, HOLDING_PROJECTION)
+    return await cursor.to_list(length=None)
+
+async def add_shares(phone_num: int, project: dict, amount: int, total_cost: float, carbon_offset: float, session=None) -> bool:
+    """Add shares to a holding in one atomic upsert; returns True when the holding is new"""
+    holdings_collection = await get_holdings_collection()
+    query, update = _add_shares_update(phone_num, project, amount, total_cost, carbon_offset)
+    result = await holdings_collection.update_one(query, update, upsert=True, session=session)
+    return result.upserted_id is not None
+
+async def remove_shares(holding: dict, project: dict, amount: int, session=None) -> Optional[dict]:
+    """Remove shares from a holding read earlier, pinned to its share count.
+
+    Returns the updated holding, or None if a concurrent trade changed it.
+    A holding that reaches zero shares is deleted.
+    """
+    holdings_collection = await get_holdings_collection()
+    increments = holding_increments(project, -amount, -holding["share_price"] * amount)
+    del increments["carbon_offset"]
+    updated = await holdings_collection.find_one_and_update(
+        {"_id": holding["_id"], "num_shares": holding["num_shares"]},
+        {"$inc": increments},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if updated is not None and updated["num_shares"] <= 0:
+        try:
+            await holdings_collection.delete_one({"_id": holding["_id"], "num_shares": {"$lte": 0}}, session=session)
+        except PyMongoError as e:
+            if session is not None:
+                raise
+            # The shares are already out; an empty holding left behind is only cosmetic
+            print(f"Error deleting empty holding: {e}")
+    return updated
+
+async def undo_add_shares(phone_num: int, project: dict, amount: int, total_cost: float, carbon_offset: float):
+    """Compensate add_shares for a buy that failed later outside a transaction"""
+    holdings_collection = await get_holdings_collection()
+    await holdings_collection.update_one(
+        {"phone_number": phone_num, "project_id": project["project_id"]},
+        {"$inc": holding_increments(project, -amount, -total_cost, -carbon_offset)}
+    )
+    await holdings_collection.delete_one(
+        {"phone_number": phone_num, "project_id": project["project_id"], "num_shares": {"$lte": 0}}
+    )
+
+async def restore_shares(holding: dict, project: dict, amount: int):
+    """Compensate remove_shares for a sell that failed later outside a transaction.
+
+    Puts the shares back, re-creating the holding if the sell emptied and deleted it.
+    """
+    holdings_collection = await get_holdings_collection()
+    increments = holding_increments(project, amount, holding["share_price"] * amount)
+    del increments["carbon_offset"]
+    kept = {
+        field: value for field, value in holding.items()
+        if field not in ("_id", "phone_number", "project_id", "num_shares", "total_investment", "profit")
+    }
+    await holdings_collection.update_one(
+        {"phone_number": holding["phone_number"], "project_id": holding["project_id"]},
+        {"$inc": increments, "$setOnInsert": kept},
+        upsert=True
+    )
+
+def portfolio_pipeline(phone_num: int) -> List[dict]:
+    """Aggregation over users that joins the user's holdings and sums them per project.
+
+    Runs on the users collection because holdings live in the same database,
+    so $lookup can use the (phone_number, project_id) index. Yields one
+    document per project; a user without holdings yields nothing.
+    """
+    return [
+        {"$match": {"phone_number": phone_num}},
+        {"$project": {"_id": 0, "phone_number": 1, "balance": 1}},
+        {"$lookup": {
+            "from": "holdings",
+            "localField": "phone_number",
+            "foreignField": "phone_number",
+            "as": "holdings"
+        }},
+        {"$unwind": "$holdings"},
+        {"$group": {
+            "_id": "$holdings.project_id",
+            "balance": {"$first": "$balance"},
+            "num_shares": {"$sum": "$holdings.num_shares"},
+            "total_investment": {"$sum": "$holdings.total_investment"},
+            "current_value": {"$sum": {"$multiply": ["$holdings.num_shares", "$holdings.current_share_value"]}},
+            "monthly_profit": {"$sum": "$holdings.profit.monthly"},
+            "quarterly_profit": {"$sum": "$holdings.profit.quarterly"},
+            "annual_profit": {"$sum": "$holdings.profit.annual"},
+            "carbon_offset": {"$sum": "$holdings.carbon_offset"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+async def delete_empty_holdings(phone_numbers: List[int], project_id: str):
+    holdings_collection = await get_holdings_collection()
+    await holdings_collection.delete_many(
+        {"phone_number": {"$in": phone_numbers}, "project_id": project_id, "num_shares": {"$lte": 0}}
+    )
+
+
+async def migrate_embedded_holdings(batch_size: int = 500) -> int:
+    """Copy every user's embedded active_stocks into the holdings collection.
+
+    Idempotent: holdings are upserted by (phone_number, project_id) and a
+    user's array is only cleared if it still matches what was copied.
+    Run it before trades are served from the holdings collection, since an
+    embedded holding replaces any holding document with the same key.
+    Returns the number of users migrated.
+    """
+    user_collection = await get_users_collection()
+    holdings_collection = await get_holdings_collection()
+    migrated = 0
+
+    cursor = user_collection.find(
+        {"active_stocks.0": {"$exists": True}},
+        {"phone_number": 1, "active_stocks": 1},
+        batch_size=batch_size
+    )
+    holding_ops, user_ops = [], []
+    async for user in cursor:
+        for stock in user["active_stocks"]:
+            holding = ProjectHolding(**{**stock, "phone_number": user["phone_number"]}).dict()
+            holding_ops.append(ReplaceOne(
+                {"phone_number": user["phone_number"], "project_id": holding["project_id"]},
+                holding,
+                upsert=True
+            ))
+        user_ops.append(UpdateOne(
+            {"_id": user["_id"], "active_stocks": user["active_stocks"]},
+            {"$set": {"active_stocks": []}}
+        ))
+        if len(user_ops) >= batch_size:
+            # Holdings first, so a crash in between never loses data
+            await holdings_collection.bulk_write(holding_ops, ordered=False)
+            result = await user_collection.bulk_write(user_ops, ordered=False)
+            migrated += result.modified_count
+            holding_ops, user_ops = [], []
+
+    if user_ops:
+        if holding_ops:
+            await holdings_collection.bulk_write(holding_ops, ordered=False)
+        result = await user_collection.bulk_write(user_ops, ordered=False)
+        migrated += result.modified_count
+    return migrated
+
+
+if __name__ == "__main__":
+    from .databaseController import connect_to_database, close_database_connection
+
+    async def main():
+        await connect_to_database()
+        try:
+            print(f"Migrated holdings for {await migrate_embedded_holdings()} users")
+        finally:
+            await close_database_connection()
+
+    asyncio.run(main())
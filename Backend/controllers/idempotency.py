@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from .databaseController import get_idempotency_collection
+
+# Idempotency-Key support for the money-moving routes. The first request with
+# a key runs; its result is kept in memory (TTL + LRU) and in the
+# idempotency_keys collection, so a retry on this or any other worker gets the
+# stored result back without touching users, holdings or projects. A duplicate
+# that arrives while the first is still running waits for its result.
+#
+# Keys are scoped to the route and phone number, and reusing a key with
+# different parameters is rejected.
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10_000))
+# How long another worker's claim on a key is honoured before it is presumed dead
+PENDING_TTL = float(os.getenv("IDEMPOTENCY_PENDING_TTL", 30))
+MAX_KEY_LENGTH = 255
+
+def request_fingerprint(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Entry:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.future = asyncio.get_running_loop().create_future()
+        self.expires = time.monotonic() + IDEMPOTENCY_TTL
+
+
+class IdempotencyCache:
+    """Results of keyed requests: in memory first, then the shared collection"""
+
+    def __init__(self, max_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_size = max_size
+        # Finished requests, least recently used first; only these are evicted
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Requests still running, which their duplicates are waiting on
+        self.running: Dict[str, _Entry] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _local(self, key: str) -> Optional[_Entry]:
+        entry = self.running.get(key)
+        if entry is not None:
+            return entry
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remember(self, key: str, entry: _Entry):
+        """Move a finished request into the LRU, evicting from its cold end"""
+        if self.running.get(key) is entry:
+            del self.running[key]
+        entry.expires = time.monotonic() + IDEMPOTENCY_TTL
+        self.entries[key] = entry
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def _claim(self, key: str, fingerprint: str) -> Tuple[bool, Optional[dict]]:
+        """Claim the key in the shared collection.
+
+        Returns (True, None) when this worker should run the request, or
+        (False, result) when another worker already finished it.
+        """
+        collection = await get_idempotency_collection()
+        now = datetime.utcnow()
+        claim = {"status": "pending", "fingerprint": fingerprint, "expires": now + timedelta(seconds=PENDING_TTL)}
+        while True:
+            try:
+                await collection.insert_one({"_id": key, **claim})
+                return True, None
+            except DuplicateKeyError:
+                pass
+            stored = await collection.find_one({"_id": key})
+            if stored is None:
+                continue  # Expired between the insert and the read
+            if stored["fingerprint"] != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with different parameters")
+            if stored["status"] == "done":
+                return False, stored["result"]
+            if stored["expires"] < datetime.utcnow():
+                # The worker that claimed it went away; take the claim over
+                taken = await collection.find_one_and_update(
+                    {"_id": key, "status": "pending", "expires": stored["expires"]},
+                    {"$set": claim}
+                )
+                if taken is not None:
+                    return True, None
+                continue
+            if datetime.utcnow() - now > timedelta(seconds=PENDING_TTL):
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(0.05)
+
+    async def _store(self, key: str, result: dict):
+        collection = await get_idempotency_collection()
+        await collection.update_one(
+            {"_id": key},
+            {"$set": {"status": "done", "result": result, "expires": datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL)}}
+        )
+
+    async def _release(self, key: str):
+        collection = await get_idempotency_collection()
+        await collection.delete_one({"_id": key, "status": "pending"})
+
+    async def run(self, key: str, params: dict, operation: Callable[[], Awaitable[dict]]) -> Tuple[dict, bool]:
+        """Run ``operation`` once per key; returns (result, replayed)"""
+        fingerprint = request_fingerprint(params)
+        entry = self._local(key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with different parameters")
+            self.hits += 1
+            # Shielded so a duplicate that disconnects does not cancel the shared result
+            return await asyncio.shield(entry.future), True
+
+        self.misses += 1
+        entry = _Entry(fingerprint)
+        self.running[key] = entry
+        try:
+            try:
+                claimed, result = await self._claim(key, fingerprint)
+            except PyMongoError as e:
+                # Without the shared store keys still deduplicate within this worker
+                print(f"Error claiming idempotency key, continuing unshared: {e}")
+                claimed, result = True, None
+            if claimed:
+                try:
+                    result = await operation()
+                except BaseException:
+                    await self._release_quietly(key)
+                    raise
+                try:
+                    await self._store(key, result)
+                except PyMongoError as e:
+                    print(f"Error storing idempotency result: {e}")
+        except BaseException as e:
+            # Failed requests are not remembered, so a retry runs again
+            if self.running.get(key) is entry:
+                del self.running[key]
+            if isinstance(e, asyncio.CancelledError):
+                entry.future.cancel()
+            elif not entry.future.done():
+                entry.future.set_exception(e)
+                entry.future.exception()  # Mark retrieved when nobody is waiting
+            raise
+        entry.future.set_result(result)
+        self._remember(key, entry)
+        return result, not claimed
+
+    async def _release_quietly(self, key: str):
+        try:
+            await self._release(key)
+        except PyMongoError as e:
+            print(f"Error releasing idempotency key: {e}")
+
+    def known(self, key: str) -> bool:
+        """Whether a request with this key is running or finished in this worker"""
+        return self._local(key) is not None
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "running": len(self.running), "hits": self.hits, "misses": self.misses}
+
+
+idempotency_cache = IdempotencyCache()
+
+def cache_key(route: str, phone_num, key: str) -> str:
+    return f"{route}:{phone_num}:{key.strip()}"
+
+async def idempotent(route: str, phone_num, key: Optional[str], params: dict,
+                     operation: Callable[[], Awaitable[dict]]) -> Tuple[dict, bool]:
+    """Run a trade route's operation under an optional Idempotency-Key.
+
+    Returns the result and whether it was replayed from an earlier request.
+    Requests without a key run as before.
+    """
+    if key is None:
+        return await operation(), False
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    return await idempotency_cache.run(cache_key(route, phone_num, key), params, operation)
@@ -0,0 +1,174 @@
+import asyncio
+import os
+from typing import Optional
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+from .databaseController import (
+    ping_database, database_reachable, get_users_collection, get_holdings_collection, getProjectCollection,
+    get_trades_collection, get_snapshots_collection, get_rate_limits_collection, get_idempotency_collection
+)
+from .projectController import PAGE_SORT
+
+# (index keys, create_index options) for every index the app relies on
+USER_INDEXES = [
+    ([("phone_number", ASCENDING)], {"name": "phone_number_unique", "unique": True}),
+]
+
+HOLDING_INDEXES = [
+    ([("phone_number", ASCENDING), ("project_id", ASCENDING)], {"name": "phone_project_unique", "unique": True}),
+]
+
+# Per-user history and snapshot-tail reads; the ts index serves the snapshot job's range scan
+TRADE_INDEXES = [
+    ([("phone_number", ASCENDING), ("ts", DESCENDING), ("_id", DESCENDING)], {"name": "phone_ts"}),
+    ([("ts", ASCENDING)], {"name": "ts"}),
+    # One dividend entry per holding per accrual period, so a resumed accrual cannot journal twice
+    ([("ref", ASCENDING), ("phone_number", ASCENDING), ("project_id", ASCENDING)],
+     {"name": "dividend_ref_unique", "unique": True, "partialFilterExpression": {"ref": {"$exists": True}}}),
+]
+
+SNAPSHOT_INDEXES = [
+    ([("phone_number", ASCENDING)], {"name": "phone_number_unique", "unique": True}),
+]
+
+# Idle rate limit buckets are removed by the server once they would be full again
+RATE_LIMIT_INDEXES = [
+    ([("expires", ASCENDING)], {"name": "expires_ttl", "expireAfterSeconds": 0}),
+]
+
+# Stored idempotent results (and abandoned claims) are removed once they expire
+IDEMPOTENCY_INDEXES = [
+    ([("expires", ASCENDING)], {"name": "expires_ttl", "expireAfterSeconds": 0}),
+]
+
+PROJECT_INDEXES = [
+    ([("project_id", ASCENDING)], {"name": "project_id_unique", "unique": True}),
+    (PAGE_SORT, {"name": "roi_project_id"}),
+    ([("project_location", ASCENDING)] + PAGE_SORT, {"name": "location_roi_project_id"}),
+]
+
+# Hot key lookups whose query plans are checked for collection scans
+KEY_LOOKUPS = [
+    (get_users_collection, "phone_number", 0),
+    (getProjectCollection, "project_id", ""),
+]
+
+def _index_specs():
+    return [
+        (get_users_collection, USER_INDEXES),
+        (get_holdings_collection, HOLDING_INDEXES),
+        (getProjectCollection, PROJECT_INDEXES),
+        (get_trades_collection, TRADE_INDEXES),
+        (get_snapshots_collection, SNAPSHOT_INDEXES),
+        (get_rate_limits_collection, RATE_LIMIT_INDEXES),
+        (get_idempotency_collection, IDEMPOTENCY_INDEXES)
+    ]
+
+async def ensure_indexes():
+    """Create the required indexes, logging (not raising) on failure.
+
+    A unique index can fail to build when the collection already holds
+    duplicates; the app still starts and index_report() shows it missing.
+    """
+    for get_collection, indexes in _index_specs():
+        collection = await get_collection()
+        for keys, options in indexes:
+            try:
+                await collection.create_index(keys, **options)
+            except PyMongoError as e:
+                print(f"Error creating index {options['name']} on {collection.name}: {e}")
+
+def _uses_collection_scan(plan: dict) -> bool:
+    if plan.get("stage") == "COLLSCAN":
+        return True
+    children = plan.get("inputStages", []) + ([plan["inputStage"]] if "inputStage" in plan else [])
+    return any(_uses_collection_scan(child) for child in children)
+
+async def index_report():
+    """Report required indexes that are missing and key lookups that scan the collection"""
+    report = {"missing": [], "collection_scans": []}
+    for get_collection, indexes in _index_specs():
+        collection = await get_collection()
+        try:
+            existing = await collection.index_information()
+        except PyMongoError as e:
+            print(f"Error listing indexes on {collection.name}: {e}")
+            continue
+        for keys, options in indexes:
+            if options["name"] not in existing:
+                report["missing"].append(f"{collection.name}.{options['name']}")
+
+    for get_collection, field, sample in KEY_LOOKUPS:
+        collection = await get_collection()
+        try:
+            explain = await collection.find({field: sample}).explain()
+        except Exception as e:
+            print(f"Error explaining {collection.name}.{field} lookup: {e}")
+            continue
+        plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if _uses_collection_scan(plan):
+            report["collection_scans"].append(f"{collection.name}.{field}")
+    return report
+
+# Seconds before the first retry when MongoDB was unreachable at startup;
+# doubles on each failed attempt up to INDEX_RETRY_MAX_INTERVAL
+INDEX_RETRY_INTERVAL = float(os.getenv("INDEX_RETRY_INTERVAL", 15))
+INDEX_RETRY_MAX_INTERVAL = float(os.getenv("INDEX_RETRY_MAX_INTERVAL", 300))
+retry_task: Optional[asyncio.Task] = None
+
+async def _database_reachable() -> bool:
+    try:
+        await ping_database()
+        return True
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        print(f"MongoDB is not reachable, index bootstrap deferred: {e}")
+        return False
+
+async def _bootstrap():
+    await ensure_indexes()
+    report = await index_report()
+    for name in report["missing"]:
+        print(f"Missing index: {name}")
+    for name in report["collection_scans"]:
+        print(f"Lookup on {name} uses a collection scan")
+    return report
+
+async def _retry_bootstrap():
+    interval = INDEX_RETRY_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        if await _database_reachable():
+            try:
+                await _bootstrap()
+                print("Deferred index bootstrap finished")
+                return
+            except PyMongoError as e:
+                print(f"Error bootstrapping indexes: {e}")
+        interval = min(interval * 2, INDEX_RETRY_MAX_INTERVAL)
+
+async def bootstrap_indexes() -> Optional[dict]:
+    """Startup step: ensure indexes and print anything that is still missing or slow.
+
+    When the server does not answer a ping, every index call would wait out
+    the server selection timeout, so the work moves to a background retry
+    instead and startup carries on; returns None in that case.
+    """
+    global retry_task
+    # The readiness ping in connect_to_database just ran; trust it rather than wait out another one
+    if not database_reachable():
+        print("MongoDB is not reachable, index bootstrap deferred")
+        if retry_task is None:
+            retry_task = asyncio.create_task(_retry_bootstrap())
+        return None
+    return await _bootstrap()
+
+async def stop_index_bootstrap():
+    global retry_task
+    if retry_task is None:
+        return
+    retry_task.cancel()
+    try:
+        await retry_task
+    except asyncio.CancelledError:
+        pass
+    retry_task = None
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from .iotpred import load_energy_model, predict_daily_kwh, device_row, consumption_from_daily
+from .metrics import charge_inference
+
+class InferenceEngine:
+    """Coalesces concurrent prediction requests into micro-batches.
+
+    Requests are queued and a single worker drains up to ``max_batch_size``
+    rows, waiting at most ``max_wait`` seconds for the batch to fill, then
+    runs one vectorized ``model.predict`` in the default thread pool so the
+    event loop is never blocked by inference.
+    """
+
+    def __init__(self, max_batch_size: int = 64, max_wait: float = 0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.worker is not None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, load_energy_model)
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+        self.worker = None
+        # Fail anything still waiting so callers are not left hanging
+        while not self.queue.empty():
+            _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(HTTPException(status_code=503, detail="Inference engine stopped"))
+        self.queue = None
+
+    async def predict(self, row: dict) -> float:
+        """Queue one device row and wait for its daily kWh prediction"""
+        if self.queue is None:
+            raise HTTPException(status_code=503, detail="Inference engine not started")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, future))
+        daily_kwh, seconds = await future
+        # The executor thread has no request context; charge the batch's model time here
+        charge_inference(seconds)
+        return daily_kwh
+
+    async def _collect(self) -> List[Tuple[dict, asyncio.Future]]:
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            rows = [row for row, _ in batch]
+            try:
+                start = time.perf_counter()
+                predictions = await loop.run_in_executor(None, predict_daily_kwh, rows)
+                seconds = time.perf_counter() - start
+            except Exception as e:
+                print(f"Error running batched inference: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(HTTPException(status_code=500, detail="Error predicting consumption"))
+                continue
+            for (_, future), daily_kwh in zip(batch, predictions):
+                if not future.done():
+                    future.set_result((float(daily_kwh), seconds))
+
+
+engine = InferenceEngine(
+    max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", 64)),
+    max_wait=float(os.getenv("INFERENCE_MAX_WAIT_MS", 5)) / 1000,
+)
+
+async def start_inference_engine():
+    await engine.start()
+
+async def stop_inference_engine():
+    await engine.stop()
+
+async def predict_consumption_async(rooms, bulbs, fans, ovens, washing_machines, acs):
+    """Batched, non-blocking counterpart of ``iotpred.predict_consumption``"""
+    daily_kwh = await engine.predict(device_row(rooms, bulbs, fans, ovens, washing_machines, acs))
+    return consumption_from_daily(daily_kwh)
@@ -1,44 +1,136 @@
 # predict.py
 
+import numpy as np
 import pandas as pd
-import joblib
-import os
+import warnings
+from typing import Iterable, List, Optional, Union
+from fastapi import HTTPException
+from .modelRegistry import registry
 
-def predict_consumption(rooms, bulbs, fans, ovens, washing_machines, acs):
-    """Predict energy consumption for given inputs"""
-        # Load model and features
-    
+# Artifact names in the model registry
+ENERGY_MODEL = 'energy_model'
+ENERGY_FEATURES = 'model_features'
+# The feature list fixes the model's column order, so they only swap together
+registry.group(ENERGY_MODEL, ENERGY_FEATURES)
 
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(base_dir, 'energy_model.joblib')
-    features_path = os.path.join(base_dir, 'model_features.joblib')
+# Route parameter names accepted as aliases for the model feature names
+feature_aliases = {
+    'rooms': 'rooms',
+    'bulb_count': 'bulbs',
+    'fan_count': 'fans',
+    'oven_count': 'ovens',
+    'washing_machine_count': 'washing_machines',
+    'ac_count': 'acs'
+}
 
-    model = joblib.load(model_path)
-    features = joblib.load(features_path)
+def load_energy_model():
+    """The resident energy model and its feature order, loaded on first use"""
+    unit = registry.get_unit(ENERGY_MODEL)
+    return unit[ENERGY_MODEL].model, unit[ENERGY_FEATURES].model
 
-        
-    # Prepare input data
-    input_data = pd.DataFrame([{
+def device_row(rooms, bulbs, fans, ovens, washing_machines, acs) -> dict:
+    """Map the route parameters onto the model's feature names"""
+    return {
         'rooms': rooms,
         'bulb_count': bulbs,
         'fan_count': fans,
         'oven_count': ovens,
         'washing_machine_count': washing_machines,
         'ac_count': acs
-    }])
-        
-        # Make prediction
-    daily_kwh = model.predict(input_data)[0]
+    }
+
+def _invalid(alias: str, index: int, missing: bool = False) -> HTTPException:
+    # Rows are counted from 1, not counting a CSV header
+    problem = "Missing" if missing else "Invalid"
+    return HTTPException(status_code=422, detail=f"{problem} value for '{alias}' in row {index + 1}")
+
+def _column(devices, feature: str):
+    alias = feature_aliases.get(feature, feature)
+    if isinstance(devices, pd.DataFrame):
+        for name in (feature, alias):
+            if name in devices.columns:
+                # Non-numeric cells become NaN and are rejected below with the rest
+                values = pd.to_numeric(devices[name], errors="coerce").to_numpy(dtype=np.float64)
+                break
+        else:
+            raise HTTPException(status_code=422, detail=f"Missing column '{alias}'")
+    else:
+        try:
+            values = np.fromiter(
+                (row[feature] if feature in row else row[alias] for row in devices),
+                dtype=np.float64,
+                count=len(devices)
+            )
+        except (KeyError, TypeError, ValueError):
+            # Only the failure path looks for the offending row
+            for index, row in enumerate(devices):
+                if not isinstance(row, dict):
+                    raise HTTPException(status_code=422, detail=f"Row {index + 1} is not a device configuration")
+                if feature not in row and alias not in row:
+                    raise _invalid(alias, index, missing=True)
+                try:
+                    float(row[feature] if feature in row else row[alias])
+                except (TypeError, ValueError):
+                    raise _invalid(alias, index)
+            raise HTTPException(status_code=422, detail=f"Missing or invalid value for '{alias}'")
+    bad = np.flatnonzero(~np.isfinite(values))
+    if len(bad):
+        raise _invalid(alias, int(bad[0]))
+    return values
+
+def feature_matrix(devices: Union[List[dict], pd.DataFrame], features: Optional[List[str]] = None) -> np.ndarray:
+    """Build a contiguous float64 matrix with columns ordered by model_features.joblib"""
+    if features is None:
+        _, features = load_energy_model()
+    matrix = np.empty((len(devices), len(features)), dtype=np.float64)
+    for i, feature in enumerate(features):
+        matrix[:, i] = _column(devices, feature)
+    return matrix
+
+def predict_daily_kwh(devices: Union[List[dict], pd.DataFrame]) -> np.ndarray:
+    """Predict daily kWh for many device rows with a single model call"""
+    # Features and model come from the same unit, even if a refresh swaps it meanwhile
+    unit = registry.get_unit(ENERGY_MODEL)
+    matrix = feature_matrix(devices, unit[ENERGY_FEATURES].model)
+    if len(matrix) == 0:
+        return np.empty(0, dtype=np.float64)
+    # The model was fitted on a DataFrame; the column order already matches
+    with registry.timed(ENERGY_MODEL, unit) as model, warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        return model.predict(matrix)
+
+def consumption_from_daily(daily_kwh):
+    """Derive monthly usage and cost from a daily kWh prediction"""
     monthly_kwh = daily_kwh * 30
     monthly_cost = monthly_kwh * 0.12 * 84
-        
-    print(f"\nPrediction for {rooms} room setup:")
-    print(f"Devices: {bulbs} bulbs, {fans} fans, {ovens} ovens, {washing_machines} washing machines, {acs} ACs")
-    print(f"Daily Usage: {daily_kwh:.2f} kWh")
-    print(f"Monthly Usage: {monthly_kwh:.2f} kWh")
-    print(f"Estimated Monthly Cost: ${monthly_cost:.2f}")
-        
     return daily_kwh, monthly_kwh, monthly_cost
-        
 
+def predict_consumption(rooms, bulbs, fans, ovens, washing_machines, acs):
+    """Predict energy consumption for given inputs"""
+    daily_kwh = predict_daily_kwh([device_row(rooms, bulbs, fans, ovens, washing_machines, acs)])[0]
+    return consumption_from_daily(daily_kwh)
+
+def predict_consumption_batch(devices: Union[List[dict], pd.DataFrame]):
+    """Predict energy consumption for many households in one model call
+
+    Args:
+        devices: list of device configurations (keyed by route parameter or
+            feature names) or a DataFrame with the same columns
+
+    Returns:
+        Tuple of NumPy arrays (daily_kwh, monthly_kwh, monthly_cost)
+    """
+    return consumption_from_daily(predict_daily_kwh(devices))
 
+def iter_consumption_rows(daily_kwh, monthly_kwh, monthly_cost, chunk_size: int = 1000) -> Iterable[List[dict]]:
+    """Yield prediction results as lists of dicts, ``chunk_size`` rows at a time"""
+    for start in range(0, len(daily_kwh), chunk_size):
+        stop = start + chunk_size
+        yield [
+            {"daily_kwh": d, "monthly_kwh": m, "monthly_cost": c}
+            for d, m, c in zip(
+                daily_kwh[start:stop].tolist(),
+                monthly_kwh[start:stop].tolist(),
+                monthly_cost[start:stop].tolist()
+            )
+        ]
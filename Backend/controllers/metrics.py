@@ -0,0 +1,281 @@
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import monitoring
+
+# Request, Mongo and inference timings, exposed on /metrics in the Prometheus
+# text format. Kept dependency-free; every observation is a lock and a few adds.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def server_timing_enabled() -> bool:
+    return os.getenv("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """A Prometheus histogram with one series per label combination"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self.lock:
+            # Per-bucket counts, then sum and count
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format_value(bound)}"}} {_format_value(cumulative)}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {_format_value(series[-1])}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {repr(series[-2])}")
+            lines.append(f"{self.name}_count{suffix} {_format_value(series[-1])}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter with one series per label combination"""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            snapshot = dict(self.series)
+        for label_values, value in sorted(snapshot.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {_format_value(value)}" if labels else f"{self.name} {_format_value(value)}")
+        return lines
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time to produce the response headers, by route", ["method", "route", "status"]
+)
+request_mongo_round_trips = Histogram(
+    "http_request_mongo_round_trips", "Mongo commands issued while serving one request", ["route"], ROUND_TRIP_BUCKETS
+)
+request_mongo_duration = Histogram(
+    "http_request_mongo_duration_seconds", "Time one request spent waiting on Mongo commands", ["route"]
+)
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "Mongo command round-trip time, by command", ["command"]
+)
+inference_duration = Histogram(
+    "model_inference_duration_seconds", "Time spent in model.predict, by model", ["model"]
+)
+
+requests_shed = Counter(
+    "http_requests_shed_total", "Requests turned away by admission control, by route and reason", ["route", "reason"]
+)
+
+ALL_METRICS = [request_duration, request_mongo_round_trips, request_mongo_duration, mongo_command_duration, inference_duration, requests_shed]
+
+
+class RequestTiming:
+    """Time spent on Mongo and inference by the request being served"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.mongo_round_trips = 0
+        self.mongo_seconds = 0.0
+        self.inference_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add_mongo(self, seconds: float):
+        with self.lock:
+            self.mongo_round_trips += 1
+            self.mongo_seconds += seconds
+
+    def add_inference(self, seconds: float):
+        with self.lock:
+            self.inference_seconds += seconds
+
+
+# Motor runs commands on its thread pool with a copy of the caller's context,
+# so listeners and executors see the RequestTiming of the request they serve
+current_request: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar("current_request", default=None)
+
+def start_request_timing() -> RequestTiming:
+    timing = RequestTiming()
+    current_request.set(timing)
+    return timing
+
+def finish_request_timing(timing: RequestTiming, method: str, route: str, status: int) -> float:
+    elapsed = time.perf_counter() - timing.start
+    request_duration.observe(elapsed, method, route, str(status))
+    request_mongo_round_trips.observe(timing.mongo_round_trips, route)
+    request_mongo_duration.observe(timing.mongo_seconds, route)
+    return elapsed
+
+def server_timing_header(timing: RequestTiming, elapsed: float) -> str:
+    return (
+        f"app;dur={elapsed * 1000:.1f}, "
+        f'db;dur={timing.mongo_seconds * 1000:.1f};desc="{timing.mongo_round_trips} round trips", '
+        f"inference;dur={timing.inference_seconds * 1000:.1f}"
+    )
+
+def record_inference(model: str, seconds: float):
+    """Record one model call, charged to the current request if there is one"""
+    inference_duration.observe(seconds, model)
+    charge_inference(seconds)
+
+def charge_inference(seconds: float):
+    """Charge inference time to the current request without recording a model call"""
+    timing = current_request.get()
+    if timing is not None:
+        timing.add_inference(seconds)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every Mongo command; pass it in the client's event_listeners"""
+
+    def started(self, event):
+        pass
+
+    def _finished(self, event):
+        seconds = event.duration_micros / 1e6
+        mongo_command_duration.observe(seconds, event.command_name)
+        timing = current_request.get()
+        if timing is not None:
+            timing.add_mongo(seconds)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Tracks open, checked-out and waiting connections per server"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # address -> [open, in use, waiting]
+        self.pools: Dict[str, List[int]] = {}
+
+    def _add(self, event, open: int = 0, in_use: int = 0, waiting: int = 0):
+        address = "%s:%s" % event.address
+        with self.lock:
+            pool = self.pools.setdefault(address, [0, 0, 0])
+            pool[0] += open
+            pool[1] += in_use
+            pool[2] += waiting
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self.lock:
+            self.pools.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        self._add(event, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add(event, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._add(event, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._add(event, waiting=-1)
+
+    def connection_checked_out(self, event):
+        self._add(event, in_use=1, waiting=-1)
+
+    def connection_checked_in(self, event):
+        self._add(event, in_use=-1)
+
+    def stats(self, client=None) -> dict:
+        """Per-server usage; saturation is in-use connections over maxPoolSize"""
+        pool_options = getattr(getattr(client, "options", None), "pool_options", None)
+        max_pool_size = getattr(pool_options, "max_pool_size", None)
+        if not isinstance(max_pool_size, int):
+            # Not a real MongoClient (e.g. a test stand-in)
+            max_pool_size = None
+        with self.lock:
+            pools = {address: list(pool) for address, pool in self.pools.items()}
+        return {
+            "max_pool_size": max_pool_size,
+            "servers": {
+                address: {
+                    "open": open,
+                    "in_use": in_use,
+                    "waiting": waiting,
+                    "saturation": in_use / max_pool_size if max_pool_size else None
+                }
+                for address, (open, in_use, waiting) in pools.items()
+            }
+        }
+
+    def render(self) -> List[str]:
+        lines = []
+        with self.lock:
+            pools = {address: list(pool) for address, pool in self.pools.items()}
+        for i, (name, help) in enumerate([
+            ("mongo_pool_connections_open", "Open connections, by server"),
+            ("mongo_pool_connections_in_use", "Checked-out connections, by server"),
+            ("mongo_pool_waiting", "Operations waiting for a connection, by server")
+        ]):
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge"])
+            lines.extend(f'{name}{{server="{_escape(address)}"}} {pool[i]}' for address, pool in sorted(pools.items()))
+        return lines
+
+
+pool_monitor = PoolMonitor()
+
+def render_metrics() -> str:
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    lines.extend(pool_monitor.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,275 @@
+import asyncio
+import os
+import pickle
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import joblib
+import numpy as np
+from fastapi import HTTPException
+from .metrics import record_inference
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+default_model_dirs = [base_dir, os.path.join(base_dir, "..", "..", "stocks", "models")]
+model_dirs = [path for path in os.getenv("MODEL_DIRS", os.pathsep.join(default_model_dirs)).split(os.pathsep) if path]
+
+# <name>_<YYYYmmdd>_<HHMMSS>.<ext>, e.g. solar_model_20241026_081134.pkl;
+# artifacts without a timestamp are versioned by their modification time
+ARTIFACT_PATTERN = re.compile(r"^(?P<name>.+?)(?:_(?P<version>\d{8}_\d{6}))?\.(?:pkl|joblib)$")
+VERSION_FORMAT = "%Y%m%d_%H%M%S"
+
+# Recent predictions kept per model for the latency percentiles
+LATENCY_WINDOW = 1024
+
+
+class Artifact:
+    """One model file on disk"""
+
+    def __init__(self, name: str, version: str, path: str):
+        self.name = name
+        self.version = version
+        self.path = path
+
+    def describe(self) -> dict:
+        return {"version": self.version, "path": self.path}
+
+
+class LoadedModel:
+    """A resident model with its load and latency statistics"""
+
+    def __init__(self, artifact: Artifact, model, load_seconds: float, memory_bytes: int):
+        self.artifact = artifact
+        self.model = model
+        self.load_seconds = load_seconds
+        self.memory_bytes = memory_bytes
+        self.loaded_at = datetime.utcnow()
+        self.predictions = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def stats(self) -> dict:
+        latencies = np.array(self.latencies, dtype=np.float64) * 1000
+        return {
+            **self.artifact.describe(),
+            "loaded_at": self.loaded_at.isoformat(),
+            "load_ms": self.load_seconds * 1000,
+            "memory_bytes": self.memory_bytes,
+            "predictions": self.predictions,
+            "latency_ms": {
+                "mean": float(latencies.mean()),
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max())
+            } if len(latencies) else None
+        }
+
+
+def discover_artifacts(directories: List[str]) -> Dict[str, List[Artifact]]:
+    """Find model artifacts by name, each name's versions sorted oldest first"""
+    artifacts: Dict[str, List[Artifact]] = {}
+    for directory in directories:
+        try:
+            filenames = os.listdir(directory)
+        except OSError:
+            continue
+        for filename in filenames:
+            match = ARTIFACT_PATTERN.match(filename)
+            if match is None:
+                continue
+            path = os.path.abspath(os.path.join(directory, filename))
+            version = match.group("version")
+            if version is None:
+                version = datetime.fromtimestamp(os.path.getmtime(path)).strftime(VERSION_FORMAT)
+            artifacts.setdefault(match.group("name"), []).append(Artifact(match.group("name"), version, path))
+    for versions in artifacts.values():
+        versions.sort(key=lambda artifact: artifact.version)
+    return artifacts
+
+
+class ModelRegistry:
+    """Discovers versioned model artifacts and keeps the active ones resident.
+
+    Models load lazily on first use. ``activate`` loads another version
+    (the newest by default) next to the current one and swaps it in, so
+    requests keep being served by the old model until the new one is ready.
+    ``refresh`` does that for every resident model that has a newer artifact,
+    except models pinned to an explicit version.
+
+    Artifacts that only work together, like a model and its feature list,
+    can be registered as a group: they load, swap and pin as one unit, and
+    ``get_unit`` hands out a consistent set.
+    """
+
+    def __init__(self, directories: List[str]):
+        self.directories = directories
+        self.artifacts: Dict[str, List[Artifact]] = {}
+        self.loaded: Dict[str, LoadedModel] = {}
+        self.groups: Dict[str, Tuple[str, ...]] = {}
+        self.pinned = set()
+        self.lock = threading.Lock()
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.discover()
+
+    def discover(self) -> Dict[str, List[Artifact]]:
+        self.artifacts = discover_artifacts(self.directories)
+        return self.artifacts
+
+    def group(self, *names: str):
+        """Version ``names`` as one unit; an explicit version must exist for all of them"""
+        for name in names:
+            self.groups[name] = names
+
+    def _members(self, name: str) -> Tuple[str, ...]:
+        return self.groups.get(name, (name,))
+
+    def _artifact(self, name: str, version: Optional[str] = None) -> Artifact:
+        versions = self.artifacts.get(name)
+        if not versions:
+            raise HTTPException(status_code=404, detail=f"Model '{name}' not found")
+        if version is None:
+            return versions[-1]
+        for artifact in versions:
+            if artifact.version == version:
+                return artifact
+        raise HTTPException(status_code=404, detail=f"Model '{name}' has no version '{version}'")
+
+    def _load(self, artifact: Artifact) -> LoadedModel:
+        start = time.perf_counter()
+        model = joblib.load(artifact.path)
+        load_seconds = time.perf_counter() - start
+        # Serialized size is a close, cheap stand-in for the resident size of array-backed models
+        memory_bytes = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+        print(f"Model {artifact.name} {artifact.version} loaded in {load_seconds * 1000:.1f} ms")
+        return LoadedModel(artifact, model, load_seconds, memory_bytes)
+
+    def get_unit(self, name: str) -> Dict[str, LoadedModel]:
+        """The resident models of ``name``'s group, read together so a swap cannot split them"""
+        members = self._members(name)
+        with self.lock:
+            if any(member not in self.loaded for member in members):
+                # First use loads the whole group at its newest artifacts
+                self.loaded.update({member: self._load(self._artifact(member)) for member in members})
+            return {member: self.loaded[member] for member in members}
+
+    def get_loaded(self, name: str) -> LoadedModel:
+        """The resident model for ``name``, loading its newest artifact on first use"""
+        loaded = self.loaded.get(name)
+        if loaded is not None:
+            return loaded
+        return self.get_unit(name)[name]
+
+    def get(self, name: str):
+        return self.get_loaded(name).model
+
+    def activate(self, name: str, version: Optional[str] = None) -> dict:
+        """Hot-swap ``name`` (and the rest of its group) to ``version`` without a restart.
+
+        An explicit version is pinned until the next activate without one,
+        which moves the model back to the newest artifact on disk.
+        """
+        self.discover()
+        members = self._members(name)
+        artifacts = {member: self._artifact(member, version) for member in members}
+        unit = {}
+        for member, artifact in artifacts.items():
+            current = self.loaded.get(member)
+            if current is None or current.artifact.path != artifact.path:
+                # Load outside the lock so predictions keep using the current models meanwhile
+                current = self._load(artifact)
+            unit[member] = current
+        with self.lock:
+            self.loaded.update(unit)
+        if version is None:
+            self.pinned.difference_update(members)
+        else:
+            self.pinned.update(members)
+        return unit[name].stats()
+
+    def refresh(self) -> List[str]:
+        """Swap every resident model whose newest artifact changed; returns the swapped names"""
+        self.discover()
+        swapped = []
+        for name, loaded in list(self.loaded.items()):
+            if name in swapped:
+                continue
+            versions = self.artifacts.get(name)
+            if name not in self.pinned and versions and versions[-1].path != loaded.artifact.path:
+                self.activate(name)
+                swapped.extend(self._members(name))
+        return swapped
+
+    @contextmanager
+    def timed(self, name: str, unit: Optional[Dict[str, LoadedModel]] = None):
+        """Record the latency of one prediction made with ``name``.
+
+        Pass the ``unit`` from get_unit when the prediction also uses other
+        members of the group, so they all come from the same version.
+        """
+        loaded = unit[name] if unit is not None else self.get_loaded(name)
+        start = time.perf_counter()
+        try:
+            yield loaded.model
+        finally:
+            seconds = time.perf_counter() - start
+            loaded.latencies.append(seconds)
+            loaded.predictions += 1
+            record_inference(name, seconds)
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "versions": [artifact.version for artifact in versions],
+                "active": self.loaded[name].stats() if name in self.loaded else None,
+                "pinned": name in self.pinned,
+                "group": list(self._members(name))
+            }
+            for name, versions in self.artifacts.items()
+        }
+
+    async def _refresh_periodically(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                print(f"Error refreshing models: {e}")
+
+    def start(self, interval: float):
+        if interval > 0 and self.refresh_task is None:
+            self.refresh_task = asyncio.create_task(self._refresh_periodically(interval))
+
+    async def stop(self):
+        if self.refresh_task is None:
+            return
+        self.refresh_task.cancel()
+        try:
+            await self.refresh_task
+        except asyncio.CancelledError:
+            pass
+        self.refresh_task = None
+
+
+registry = ModelRegistry(model_dirs)
+
+async def start_model_registry():
+    # Rescan for newer artifacts every MODEL_REFRESH_INTERVAL seconds; 0 disables
+    registry.start(float(os.getenv("MODEL_REFRESH_INTERVAL", 60)))
+
+async def stop_model_registry():
+    await registry.stop()
+
+async def activateModel(name: str, version: Optional[str] = None):
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, registry.activate, name, version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error activating model {name}: {e}")
+        raise HTTPException(status_code=500, detail="Error activating model")
+
+def getModelStats():
+    return registry.stats()
@@ -0,0 +1,416 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from uuid import uuid4
+from pymongo import ReturnDocument, UpdateOne
+from controllers.databaseController import get_users_collection, get_holdings_collection, getProjectCollection, normalize_phone
+from controllers.holdingsRepository import holding_increments, holding_defaults, delete_empty_holdings
+from controllers.stocksTransactionController import buyShare, sellShare, validate_amount
+from controllers.tradeLedger import record_trades, trade_entry
+
+class Order:
+    def __init__(self, side: str, phone_num: int, project_id: str, amount: int):
+        self.side = side
+        self.phone_num = phone_num
+        self.project_id = project_id
+        self.amount = amount
+        self.future = asyncio.get_running_loop().create_future()
+        self.result: Optional[dict] = None
+        self.available_after = 0
+        self.balance_after = 0.0
+        self.cash = 0.0
+
+
+class _Position:
+    """In-memory view of one user's balance and holding while a window is settled"""
+
+    def __init__(self, user: dict, holding: Optional[dict], project: dict):
+        self.holding = holding
+        self.balance = user["balance"]
+        self.shares = holding["num_shares"] if holding else 0
+        self.orig_shares = self.shares
+        self.share_price = holding["share_price"] if holding else project["project_subscription_cost"]
+        self.share_value = holding["current_share_value"] if holding else project["project_subscription_cost"]
+        self.balance_delta = 0.0
+        self.investment_delta = 0.0
+        self.carbon_delta = 0.0
+        self.orders: List[Order] = []
+
+    @property
+    def share_delta(self) -> int:
+        return self.shares - self.orig_shares
+
+    @property
+    def moves_holding(self) -> bool:
+        return bool(self.share_delta or self.investment_delta or self.carbon_delta)
+
+
+async def _settle_individually(orders: List[Order]):
+    # Fallback path: every order goes through the atomic single-trade controller
+    for order in orders:
+        if order.side == "buy":
+            order.result = await buyShare(order.phone_num, order.project_id, order.amount)
+        else:
+            order.result = await sellShare(order.phone_num, order.project_id, order.amount)
+
+
+def _apply_orders(project: dict, positions: Dict[int, _Position], orders: List[Order]):
+    """Match orders in arrival order against the project and user positions.
+
+    Returns the project counter deltas. Shares are allocated FIFO, and a
+    sell earlier in the window frees shares for later buyers.
+    """
+    available = project.get("available_shares", 0)
+    price = project["project_subscription_cost"]
+    earnings_per_share = project["earnings_per_share"]
+    accepted = 0
+
+    for order in orders:
+        position = positions.get(order.phone_num)
+        if position is None:
+            order.result = {"message": "User not found"}
+            continue
+
+        if order.side == "buy":
+            total_cost = price * order.amount
+            if available < order.amount:
+                order.result = {"message": "Not enough shares available"}
+                continue
+            if position.balance < total_cost:
+                order.result = {"message": "Insufficient funds"}
+                continue
+            available -= order.amount
+            accepted += 1
+            position.balance -= total_cost
+            position.balance_delta -= total_cost
+            position.shares += order.amount
+            position.investment_delta += total_cost
+            position.carbon_delta += project["annual_carbon_offset"] / project["project_size"] * order.amount
+            order.cash = -total_cost
+            order.result = {
+                "message": "Shares purchased successfully",
+                "amount_purchased": order.amount
+            }
+        else:
+            if position.shares == 0:
+                order.result = {"message": "User does not own shares of this project"}
+                continue
+            if position.shares < order.amount:
+                order.result = {"message": "Insufficient shares to sell"}
+                continue
+            total_earnings = position.share_value * order.amount
+            credit = total_earnings + (earnings_per_share * order.amount)
+            available += order.amount
+            position.balance += credit
+            position.balance_delta += credit
+            position.shares -= order.amount
+            position.investment_delta -= position.share_price * order.amount
+            order.cash = credit
+            order.result = {
+                "message": "Shares sold successfully",
+                "amount_sold": order.amount,
+                "earnings_from_sale": total_earnings
+            }
+
+        position.orders.append(order)
+        order.available_after = available
+        order.balance_after = position.balance
+
+    opened = sum(1 for p in positions.values() if p.orig_shares == 0 and p.shares > 0)
+    closed = sum(1 for p in positions.values() if p.orig_shares > 0 and p.shares == 0)
+    return {
+        "available_shares": available - project.get("available_shares", 0),
+        "subscribers_accepted": accepted,
+        "active_subscribers": opened - closed
+    }
+
+
+def _balance_update(phone_num: int, position: _Position, batch_id: str) -> UpdateOne:
+    """Conditional balance update that applies a user's netted orders"""
+    query = {"phone_number": phone_num}
+    if position.balance_delta < 0:
+        query["balance"] = {"$gte": -position.balance_delta}
+    return UpdateOne(query, {"$inc": {"balance": position.balance_delta}, "$set": {"last_order_batch": batch_id}})
+
+
+def _holding_update(phone_num: int, position: _Position, project: dict, batch_id: str) -> UpdateOne:
+    """Holding update for a user's netted orders.
+
+    Net sells are pinned to the share count that was read so they cannot
+    oversell; net buys are plain upserts that create the holding if needed.
+    """
+    increments = holding_increments(project, position.share_delta, position.investment_delta, position.carbon_delta)
+    if position.share_delta < 0:
+        return UpdateOne(
+            {"_id": position.holding["_id"], "num_shares": position.orig_shares},
+            {"$inc": increments, "$set": {"last_order_batch": batch_id}}
+        )
+    return UpdateOne(
+        {"phone_number": phone_num, "project_id": project["project_id"]},
+        {"$inc": increments, "$set": {"last_order_batch": batch_id}, "$setOnInsert": holding_defaults(project)},
+        upsert=True
+    )
+
+
+def _journal_entries(positions: List[_Position], project: dict) -> List[dict]:
+    """One journal entry per settled order, all stamped with the window's settle time"""
+    ts = datetime.utcnow()
+    entries = []
+    for position in positions:
+        for order in position.orders:
+            if order.side == "buy":
+                entries.append(trade_entry("buy", order.phone_num, order.cash, order.project_id, order.amount, project["project_subscription_cost"], ts))
+            else:
+                entries.append(trade_entry("sell", order.phone_num, order.cash, order.project_id, -order.amount, position.share_value, ts))
+    return entries
+
+
+def _revert_holding_update(position: _Position, project: dict, batch_id: str) -> UpdateOne:
+    """Give a seller's shares back; moving the marker on makes a repeat a no-op"""
+    increments = holding_increments(project, -position.share_delta, -position.investment_delta, -position.carbon_delta)
+    return UpdateOne(
+        {"_id": position.holding["_id"], "last_order_batch": batch_id},
+        {"$inc": increments, "$set": {"last_order_batch": f"{batch_id}-reverted"}}
+    )
+
+
+async def _marked(collection, query: dict, batch_id: str, key: str) -> Dict:
+    """Documents matching ``query`` that carry this window's marker, keyed by ``key``"""
+    query = dict(query, last_order_batch=batch_id)
+    return {doc[key]: doc async for doc in collection.find(query)}
+
+
+def _reverse(positions: List[_Position]) -> dict:
+    """Project counter deltas that undo the given positions' share of a window"""
+    reverse = {"available_shares": 0, "subscribers_accepted": 0, "active_subscribers": 0}
+    for position in positions:
+        for order in position.orders:
+            if order.side == "buy":
+                reverse["available_shares"] += order.amount
+                reverse["subscribers_accepted"] -= 1
+            else:
+                reverse["available_shares"] -= order.amount
+        if position.orig_shares == 0 and position.shares > 0:
+            reverse["active_subscribers"] -= 1
+        elif position.orig_shares > 0 and position.shares == 0:
+            reverse["active_subscribers"] += 1
+    return reverse
+
+
+async def _recover_window(project: dict, touched: Dict[int, _Position], sellers: Dict[int, _Position], batch_id: str) -> Dict:
+    """Finish a window whose writes failed part way, from the markers it left.
+
+    Sellers that were not paid get their shares back and paid buyers get any
+    holding upsert that did not land. Returns the users whose balance update
+    went through, like ``applied`` in settle_orders.
+    """
+    user_collection = await get_users_collection()
+    holdings_collection = await get_holdings_collection()
+
+    applied = await _marked(user_collection, {"phone_number": {"$in": list(touched)}}, batch_id, "phone_number")
+    if sellers:
+        sold = await _marked(holdings_collection, {"_id": {"$in": [p.holding["_id"] for p in sellers.values()]}}, batch_id, "phone_number")
+        unpaid = [sellers[phone] for phone in sold if phone not in applied]
+        if unpaid:
+            await holdings_collection.bulk_write([_revert_holding_update(p, project, batch_id) for p in unpaid], ordered=False)
+
+    buyers = [phone for phone in applied if phone not in sellers and touched[phone].moves_holding]
+    if buyers:
+        written = await _marked(holdings_collection, {"phone_number": {"$in": buyers}, "project_id": project["project_id"]}, batch_id, "phone_number")
+        pending = [_holding_update(phone, touched[phone], project, batch_id) for phone in buyers if phone not in written]
+        if pending:
+            await holdings_collection.bulk_write(pending, ordered=False)
+    return applied
+
+
+async def _write_window(project: dict, touched: Dict[int, _Position], sellers: Dict[int, _Position], batch_id: str) -> Dict:
+    """Bulk holding and balance writes for a window; returns the users that were paid"""
+    user_collection = await get_users_collection()
+    holdings_collection = await get_holdings_collection()
+
+    # 1. Net sellers give up shares first, pinned to the holding that was read
+    sold = {}
+    if sellers:
+        await holdings_collection.bulk_write(
+            [_holding_update(phone, position, project, batch_id) for phone, position in sellers.items()],
+            ordered=False
+        )
+        sold = await _marked(holdings_collection, {"_id": {"$in": [p.holding["_id"] for p in sellers.values()]}}, batch_id, "phone_number")
+
+    # 2. Balances for everyone whose holding side went through
+    payable = {phone: position for phone, position in touched.items() if phone not in sellers or phone in sold}
+    applied = {}
+    if payable:
+        await user_collection.bulk_write(
+            [_balance_update(phone, position, batch_id) for phone, position in payable.items()],
+            ordered=False
+        )
+        applied = await _marked(user_collection, {"phone_number": {"$in": list(payable)}}, batch_id, "phone_number")
+
+    # A seller whose balance update missed gets their shares back
+    unpaid = [sellers[phone] for phone in sold if phone not in applied]
+    if unpaid:
+        await holdings_collection.bulk_write([_revert_holding_update(p, project, batch_id) for p in unpaid], ordered=False)
+
+    # 3. Net buyers (and other holding changes) are unconditional upserts
+    buyers = [
+        _holding_update(phone, position, project, batch_id)
+        for phone, position in touched.items()
+        if phone in applied and phone not in sellers and position.moves_holding
+    ]
+    if buyers:
+        await holdings_collection.bulk_write(buyers, ordered=False)
+    return applied
+
+
+async def settle_orders(project_id: str, orders: List[Order]):
+    """Net a window of orders into one project update and bulk user/holding writes"""
+    user_collection = await get_users_collection()
+    holdings_collection = await get_holdings_collection()
+    project_collection = await getProjectCollection()
+
+    project = await project_collection.find_one({"project_id": project_id})
+    if project is None:
+        for order in orders:
+            order.result = {"message": "Project not found"}
+        return
+
+    phones = list({order.phone_num for order in orders})
+    holdings = {
+        holding["phone_number"]: holding
+        async for holding in holdings_collection.find({"phone_number": {"$in": phones}, "project_id": project_id})
+    }
+    positions = {
+        user["phone_number"]: _Position(user, holdings.get(user["phone_number"]), project)
+        async for user in user_collection.find({"phone_number": {"$in": phones}}, {"phone_number": 1, "balance": 1})
+    }
+
+    deltas = _apply_orders(project, positions, orders)
+    touched = {phone: position for phone, position in positions.items() if position.orders}
+    if not touched:
+        return
+
+    # One conditional write to the hot project document for the whole window
+    query = {"project_id": project_id}
+    if deltas["available_shares"] < 0:
+        query["available_shares"] = {"$gte": -deltas["available_shares"]}
+    updated_project = await project_collection.find_one_and_update(
+        query,
+        {"$inc": deltas},
+        projection={"available_shares": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated_project is None:
+        # Another writer moved the project under us; fall back to per-order trades
+        await _settle_individually([order for position in touched.values() for order in position.orders])
+        return
+
+    batch_id = uuid4().hex
+    sellers = {phone: position for phone, position in touched.items() if position.share_delta < 0}
+    try:
+        applied = await _write_window(project, touched, sellers, batch_id)
+    except Exception as e:
+        # The project update already reserved the shares, so the window has to be
+        # finished or undone rather than failed as a whole
+        print(f"Error writing order window for {project_id}, recovering: {e}")
+        try:
+            applied = await _recover_window(project, touched, sellers, batch_id)
+        except Exception as recovery_error:
+            print(f"Error recovering order window {batch_id} for {project_id}: {recovery_error}")
+            raise e
+
+    missed = [position for phone, position in touched.items() if phone not in applied]
+    if missed:
+        # Undo the missed users' share of the project update before anything else can fail
+        await project_collection.update_one({"project_id": project_id}, {"$inc": _reverse(missed)})
+    await delete_empty_holdings(list(applied), project_id)
+    # The whole window's journal entries go in one unordered insert
+    await record_trades(_journal_entries([touched[phone] for phone in applied], project))
+    if missed:
+        # Missed users are retried one by one
+        await _settle_individually([order for position in missed for order in position.orders])
+
+    available_drift = updated_project["available_shares"] - (project.get("available_shares", 0) + deltas["available_shares"])
+    for phone, user in applied.items():
+        position = touched[phone]
+        balance_drift = user["balance"] - position.balance
+        for order in position.orders:
+            order.result["updated_balance"] = order.balance_after + balance_drift
+            order.result["updated_available_shares"] = order.available_after + available_drift
+
+
+class ProjectOrderQueue:
+    """Collects orders for one project and settles them once per window"""
+
+    def __init__(self, project_id: str, window: float, max_batch_size: int):
+        self.project_id = project_id
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.orders: List[Order] = []
+        self.full = asyncio.Event()
+        self.flush_task: Optional[asyncio.Task] = None
+        # Windows for the same project settle one at a time
+        self.lock = asyncio.Lock()
+        # Flushes started and not finished, including ones waiting on the lock
+        self.pending_flushes = 0
+
+    async def submit(self, order: Order) -> dict:
+        self.orders.append(order)
+        if len(self.orders) >= self.max_batch_size:
+            self.full.set()
+        if self.flush_task is None:
+            self.pending_flushes += 1
+            self.flush_task = asyncio.create_task(self._flush())
+        return await order.future
+
+    async def _flush(self):
+        try:
+            await asyncio.wait_for(self.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        orders, self.orders = self.orders, []
+        self.full.clear()
+        self.flush_task = None
+
+        try:
+            async with self.lock:
+                try:
+                    await settle_orders(self.project_id, orders)
+                except Exception as e:
+                    print(f"Error settling orders for {self.project_id}: {e}")
+                    for order in orders:
+                        if not order.future.done():
+                            order.future.set_exception(e)
+        finally:
+            self.pending_flushes -= 1
+        for order in orders:
+            if not order.future.done():
+                order.future.set_result(order.result)
+        # Only the last flush drops the queue: while another one waits on the
+        # lock, a new queue would bring a second lock for the same project
+        if not self.orders and self.pending_flushes == 0:
+            queues.pop(self.project_id, None)
+
+
+order_window = float(os.getenv("ORDER_BATCH_WINDOW_MS", 10)) / 1000
+order_max_batch_size = int(os.getenv("ORDER_BATCH_MAX_SIZE", 256))
+queues: Dict[str, ProjectOrderQueue] = {}
+
+async def submit_order(side: str, phone_num: int, share_id: str, amount: int) -> dict:
+    """Queue a buy or sell order and wait for its individual result.
+
+    Setting ORDER_BATCH_WINDOW_MS to 0 sends orders straight to the
+    single-trade controller.
+    """
+    phone_num = normalize_phone(phone_num)
+    validate_amount(amount)
+    if order_window <= 0:
+        if side == "buy":
+            return await buyShare(phone_num, share_id, amount)
+        return await sellShare(phone_num, share_id, amount)
+
+    queue = queues.get(share_id)
+    if queue is None:
+        queue = queues[share_id] = ProjectOrderQueue(share_id, order_window, order_max_batch_size)
+    return await queue.submit(Order(side, phone_num, share_id, amount))
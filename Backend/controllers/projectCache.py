@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from pymongo.errors import OperationFailure, PyMongoError
+from .databaseController import get_catalog_collection, database_reachable
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder is the fallback
+    orjson = None
+
+def serialize_document(doc):
+    """Convert MongoDB document to JSON serializable format."""
+    doc['_id'] = str(doc['_id'])  # Convert ObjectId to string
+    return doc
+
+# Server error codes for "no change streams here" (standalone mongod, or a
+# deployment that does not support them); anything else is retried
+CHANGE_STREAMS_UNSUPPORTED = {40573, 115, 20}
+# The resume token fell off the oplog or is no longer valid; start over with a reload
+RESUME_FAILED = {260, 280, 286}
+WATCH_RETRY_INTERVAL = float(os.getenv("PROJECT_WATCH_RETRY_INTERVAL", 1))
+WATCH_RETRY_MAX_INTERVAL = float(os.getenv("PROJECT_WATCH_RETRY_MAX_INTERVAL", 60))
+
+def encode_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str)
+    return json.dumps(payload, default=str, separators=(",", ":")).encode()
+
+class ProjectCache:
+    """In-memory read-through cache of the project catalog.
+
+    Projects are keyed by ``project_id`` with a per-location index kept
+    sorted by ``expected_roi``. A MongoDB change stream applies updates
+    incrementally and is resumed from its last event after errors; when
+    change streams are unavailable (standalone mongod), or while the stream
+    is down, the whole catalog is reloaded once it is older than ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self.projects: Dict[str, dict] = {}
+        self.ids: Dict[str, str] = {}  # Mongo _id -> project_id, for delete events
+        self.by_location: Dict[str, List[dict]] = {}
+        self.loaded_at: Optional[float] = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.watching = False
+        self.watch_task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        # Pre-encoded JSON bodies keyed by location (None for the full list)
+        self.encoded: Dict[Optional[str], Tuple[int, bytes, str]] = {}
+
+    def _index_location(self, location: str):
+        projects = [p for p in self.projects.values() if p.get("project_location") == location]
+        if projects:
+            projects.sort(key=lambda x: x["expected_roi"], reverse=True)
+            self.by_location[location] = projects
+        else:
+            self.by_location.pop(location, None)
+
+    def _put(self, doc: dict):
+        doc = serialize_document(doc)
+        old = self.projects.get(doc["project_id"])
+        self.projects[doc["project_id"]] = doc
+        self.ids[doc["_id"]] = doc["project_id"]
+        if old is not None and old.get("project_location") != doc.get("project_location"):
+            self._index_location(old.get("project_location"))
+        self._index_location(doc.get("project_location"))
+
+    def _remove(self, object_id: str):
+        project_id = self.ids.pop(object_id, None)
+        old = self.projects.pop(project_id, None)
+        if old is not None:
+            self._index_location(old.get("project_location"))
+
+    async def reload(self):
+        project_collection = await get_catalog_collection()
+        projects = await project_collection.find().to_list(length=None)
+        self.projects = {}
+        self.ids = {}
+        for doc in projects:
+            doc = serialize_document(doc)
+            self.projects[doc["project_id"]] = doc
+            self.ids[doc["_id"]] = doc["project_id"]
+        self.by_location = {}
+        for location in {p.get("project_location") for p in self.projects.values()}:
+            self._index_location(location)
+        self.loaded_at = time.monotonic()
+        self.version += 1
+
+    def apply_change(self, change: dict):
+        """Apply one change stream event to the cache"""
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is None:
+                # The document was deleted before the update could be looked up
+                self._remove(str(change["documentKey"]["_id"]))
+            else:
+                self._put(doc)
+        elif operation == "delete":
+            self._remove(str(change["documentKey"]["_id"]))
+        else:
+            # drop/rename/invalidate: force a reload on the next read
+            self.loaded_at = None
+            return
+        self.version += 1
+
+    async def _watch(self):
+        project_collection = await get_catalog_collection()
+        resume_token = None
+        delay = WATCH_RETRY_INTERVAL
+        while True:
+            try:
+                async with project_collection.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.watching = True
+                    delay = WATCH_RETRY_INTERVAL
+                    if resume_token is None:
+                        # Reload after opening a fresh stream so nothing between the two is missed
+                        async with self.lock:
+                            await self.reload()
+                    async for change in stream:
+                        self.apply_change(change)
+                        # After an invalidate the stream is over and cannot be resumed
+                        resume_token = None if change.get("operationType") == "invalidate" else stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    print(f"Project change stream unavailable, using TTL refresh: {e}")
+                    self.watching = False
+                    return
+                if e.code in RESUME_FAILED:
+                    resume_token = None
+                print(f"Project change stream failed, retrying in {delay:.0f}s: {e}")
+            except PyMongoError as e:
+                # Network errors and elections: resume from the last event once the server is back
+                print(f"Project change stream interrupted, retrying in {delay:.0f}s: {e}")
+            except Exception as e:
+                # Not a server error, so retrying will not help (e.g. a client without watch())
+                print(f"Project change stream unavailable, using TTL refresh: {e}")
+                self.watching = False
+                return
+            else:
+                # The stream ended cleanly (invalidate); reopen it right away
+                self.watching = False
+                continue
+            # TTL refreshes cover reads until the stream is back
+            self.watching = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WATCH_RETRY_MAX_INTERVAL)
+
+    def _is_fresh(self) -> bool:
+        if self.loaded_at is None:
+            return False
+        return self.watching or time.monotonic() - self.loaded_at < self.ttl
+
+    async def ensure_fresh(self):
+        if self._is_fresh():
+            self.hits += 1
+            return
+        async with self.lock:
+            if self._is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            await self.reload()
+
+    async def start(self):
+        if database_reachable():
+            await self.reload()
+        else:
+            # A reload would hold up startup for the whole server selection timeout;
+            # the watcher loads the catalog once it can open a stream
+            print("MongoDB is not reachable, project cache will warm in the background")
+        if self.watch_task is None:
+            self.watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self.watch_task is not None:
+            self.watch_task.cancel()
+            try:
+                await self.watch_task
+            except asyncio.CancelledError:
+                pass
+            self.watch_task = None
+        self.watching = False
+
+    async def get_all(self) -> List[dict]:
+        await self.ensure_fresh()
+        return list(self.projects.values())
+
+    async def get_by_location(self, location: str) -> List[dict]:
+        await self.ensure_fresh()
+        return self.by_location.get(location, [])
+
+    async def get_many(self, project_ids: List[str]) -> Dict[str, dict]:
+        """Projects by project_id; unknown ids are left out"""
+        await self.ensure_fresh()
+        return {pid: self.projects[pid] for pid in project_ids if pid in self.projects}
+
+    def _encode(self, location: Optional[str]) -> Tuple[bytes, str]:
+        entry = self.encoded.get(location)
+        if entry is not None and entry[0] == self.version:
+            return entry[1], entry[2]
+        payload = list(self.projects.values()) if location is None else self.by_location.get(location, [])
+        body = encode_json(payload)
+        # Content-derived so every worker hands out the same ETag for the same catalog
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        if location is None or location in self.by_location:
+            self.encoded[location] = (self.version, body, etag)
+        return body, etag
+
+    async def get_encoded(self, location: Optional[str] = None) -> Tuple[bytes, str]:
+        """Return the JSON body and strong ETag for the full list or one location"""
+        await self.ensure_fresh()
+        return self._encode(location)
+
+    def stats(self) -> dict:
+        return {
+            "projects": len(self.projects),
+            "locations": len(self.by_location),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "watching": self.watching
+        }
+
+
+project_cache = ProjectCache(ttl=float(os.getenv("PROJECT_CACHE_TTL", 60)))
+
+async def start_project_cache():
+    try:
+        await project_cache.start()
+    except Exception as e:
+        # The cache warms itself on first read if startup could not reach Mongo
+        print(f"Error warming project cache: {e}")
+
+async def stop_project_cache():
+    await project_cache.stop()
@@ -1,39 +1,97 @@
+import base64
+import json
 from bson import ObjectId  # Import ObjectId for handling MongoDB ObjectIds
 from models.projectSchema import Project
 from controllers.databaseController import client
 from fastapi import HTTPException
-from .databaseController import getProjectCollection
+from pymongo import ASCENDING, DESCENDING
+from typing import List, Optional
+from .databaseController import get_catalog_collection
+from .projectCache import project_cache, serialize_document
 
-def serialize_document(doc):
-    """Convert MongoDB document to JSON serializable format."""
-    doc['_id'] = str(doc['_id'])  # Convert ObjectId to string
-    return doc
+# Pages are ordered by ROI, with project_id as the tie-breaker that makes cursors stable
+PAGE_SORT = [("expected_roi", DESCENDING), ("project_id", ASCENDING)]
+
+# Fields a page may be narrowed to: the Project model plus the counters trades keep
+# on the document (the model's subscriptions_accepted is never written).
+# Anything else (operators, dotted paths) never reaches the projection
+PAGE_FIELDS = set(Project.model_fields) | {"_id", "available_shares", "subscribers_accepted"}
+
+def encode_cursor(project: dict) -> str:
+    raw = json.dumps([project["expected_roi"], project["project_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        expected_roi, project_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(expected_roi), str(project_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
 
 async def getAllProjects():
     try:
-        project_collection = await getProjectCollection()
-        projects_cursor = project_collection.find()
-        
-        # Convert cursor to a list of dictionaries and serialize each document
-        projects = [serialize_document(project) for project in await projects_cursor.to_list(length=None)]
-        
-        return projects  # Directly return the list of projects
+        # Served from the in-memory catalog, refreshed by change stream or TTL
+        return await project_cache.get_all()
     except Exception as e:
         print(f"Error fetching projects: {e}")
         raise HTTPException(status_code=500, detail="Error fetching projects")
-    
+
 async def getProjectsByLocation(location: str):
     try:
-        project_collection = await getProjectCollection()
-        projects_cursor = project_collection.find({"project_location": location})
-        
-        # Convert cursor to a list of dictionaries and serialize each document
-        projects = [serialize_document(project) for project in await projects_cursor.to_list(length=None)]
-        
-        # Sort the projects based on expected ROI in descending order
-        projects.sort(key=lambda x: x["expected_roi"], reverse=True)
-        
-        return projects  # Directly return the list of projects
+        # The per-location index is kept sorted by expected ROI in descending order
+        return await project_cache.get_by_location(location)
     except Exception as e:
         print(f"Error fetching projects by location: {e}")
         raise HTTPException(status_code=500, detail="Error fetching projects by location")
+
+async def getAllProjectsEncoded():
+    try:
+        return await project_cache.get_encoded()
+    except Exception as e:
+        print(f"Error fetching projects: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching projects")
+
+async def getProjectsByLocationEncoded(location: str):
+    try:
+        return await project_cache.get_encoded(location)
+    except Exception as e:
+        print(f"Error fetching projects by location: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching projects by location")
+
+async def getProjectsPage(location: Optional[str], limit: int, after: Optional[str] = None, fields: Optional[List[str]] = None):
+    """Fetch one page of projects sorted by expected ROI, keyset-paginated on (expected_roi, project_id)"""
+    query = {}
+    if location is not None:
+        query["project_location"] = location
+    if after:
+        expected_roi, project_id = decode_cursor(after)
+        query["$or"] = [
+            {"expected_roi": {"$lt": expected_roi}},
+            {"expected_roi": expected_roi, "project_id": {"$gt": project_id}}
+        ]
+
+    projection = None
+    if fields:
+        unknown = [field for field in fields if field not in PAGE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        # The cursor keys are always needed to build the next cursor
+        projection = {field: 1 for field in fields}
+        projection.update({"expected_roi": 1, "project_id": 1})
+
+    try:
+        project_collection = await get_catalog_collection()
+        cursor = project_collection.find(query, projection).sort(PAGE_SORT).limit(limit + 1)
+        projects = [serialize_document(project) for project in await cursor.to_list(length=limit + 1)]
+    except Exception as e:
+        print(f"Error fetching project page: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching projects")
+
+    next_cursor = None
+    if len(projects) > limit:
+        projects = projects[:limit]
+        next_cursor = encode_cursor(projects[-1])
+    return {"projects": projects, "next_cursor": next_cursor}
+
+def getProjectCacheStats():
+    return project_cache.stats()
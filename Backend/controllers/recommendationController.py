@@ -0,0 +1,108 @@
+import asyncio
+import importlib.util
+import os
+import warnings
+from typing import List, Optional
+import numpy as np
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from .modelRegistry import registry
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+stocks_dir = os.getenv("STOCKS_DIR", os.path.join(base_dir, "..", "..", "stocks"))
+solar_data_path = os.getenv("SOLAR_DATA_CSV", os.path.join(stocks_dir, "solar_installation_analysis_monthly.csv"))
+# Stream the dataset in chunks of this many rows into compact arrays; 0 loads it whole
+solar_chunk_size = int(os.getenv("SOLAR_CHUNK_SIZE", "0"))
+
+# Built once at startup and shared read-only by every request
+predictor = None
+
+# Registry artifact bundling {'model', 'scaler', 'location_data'}; the model
+# predicts an installation's annual generation in kWh
+SOLAR_MODEL = "solar_model"
+SUMMER_MONTHS = [5, 6, 7, 8]
+WINTER_MONTHS = [11, 12, 1, 2]
+
+def load_stockpred():
+    """Import stocks/stockpred.py, which lives outside the Backend package"""
+    spec = importlib.util.spec_from_file_location("stockpred", os.path.join(stocks_dir, "stockpred.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def build_predictor():
+    stockpred = load_stockpred()
+    if solar_chunk_size > 0:
+        return stockpred.StreamingSolarPredictor(solar_data_path, chunk_size=solar_chunk_size)
+    return stockpred.SolarPredictor(solar_data_path)
+
+async def start_recommendation_engine():
+    global predictor
+    try:
+        predictor = await asyncio.get_running_loop().run_in_executor(None, build_predictor)
+        print("Solar predictor loaded")
+    except Exception as e:
+        # The rest of the API still works; /recommend-project answers 503
+        print(f"Error loading solar predictor: {e}")
+
+async def recommendProject(monthly_consumption: float, top_k: Optional[int] = None, location: Optional[str] = None,
+                           min_roi: Optional[float] = None, max_payback_years: Optional[float] = None):
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Recommendation engine not available")
+    if monthly_consumption <= 0:
+        raise HTTPException(status_code=400, detail="Monthly consumption must be positive")
+    try:
+        if top_k is None and location is None and min_roi is None and max_payback_years is None:
+            return await run_in_threadpool(predictor.predict_and_analyze, monthly_consumption)
+        return await run_in_threadpool(
+            predictor.predict_top_k, monthly_consumption, top_k or 1, location, min_roi, max_payback_years
+        )
+    except Exception as e:
+        print(f"Error recommending project: {e}")
+        raise HTTPException(status_code=500, detail="Error recommending project")
+
+
+def solar_features(panel_size: float, panel_capacity: float, panel_efficiency: float, inverter_efficiency: float,
+                   sunlight_hours: float, monthly_generation: List[float]) -> dict:
+    """The solar model's inputs, with the seasonal features derived like stockpred does"""
+    monthly = np.asarray(monthly_generation, dtype=np.float64)
+    return {
+        "Panel_Size_m2": panel_size,
+        "Panel_Capacity_kW": panel_capacity,
+        "Panel_Efficiency_Percent": panel_efficiency,
+        "Inverter_Efficiency_Percent": inverter_efficiency,
+        "Sunlight_Hours": sunlight_hours,
+        "Summer_Generation": float(monthly[[month - 1 for month in SUMMER_MONTHS]].mean()),
+        "Winter_Generation": float(monthly[[month - 1 for month in WINTER_MONTHS]].mean()),
+        "Generation_Variance": float(monthly.var(ddof=1))
+    }
+
+def predict_generation(features: dict, location: Optional[str] = None) -> dict:
+    """Annual generation of one installation from the active solar model"""
+    unit = registry.get_unit(SOLAR_MODEL)
+    with registry.timed(SOLAR_MODEL, unit) as bundle, warnings.catch_warnings():
+        # The scaler was fitted on a DataFrame; the column order follows it
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        scaler = bundle["scaler"]
+        row = np.array([[features[name] for name in scaler.feature_names_in_]], dtype=np.float64)
+        annual_generation = float(bundle["model"].predict(scaler.transform(row))[0])
+        sale_rate = bundle["location_data"]["rates"].get(location) if location else None
+    return {
+        "predicted_annual_generation": annual_generation,
+        "energy_sale_rate": sale_rate,
+        "estimated_annual_revenue": annual_generation * sale_rate if sale_rate is not None else None,
+        "model_version": unit[SOLAR_MODEL].artifact.version
+    }
+
+async def predictGeneration(panel_size: float, panel_capacity: float, panel_efficiency: float, inverter_efficiency: float,
+                            sunlight_hours: float, monthly_generation: List[float], location: Optional[str] = None):
+    if len(monthly_generation) != 12:
+        raise HTTPException(status_code=422, detail="monthly_generation needs one value per month (12)")
+    features = solar_features(panel_size, panel_capacity, panel_efficiency, inverter_efficiency, sunlight_hours, monthly_generation)
+    try:
+        return await run_in_threadpool(predict_generation, features, location)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error predicting generation: {e}")
+        raise HTTPException(status_code=500, detail="Error predicting generation")
@@ -1,203 +1,243 @@
+import math
 from uuid import UUID
-from controllers.databaseController import get_users_collection, getProjectCollection
-from datetime import datetime
-from models.projectSchema import ProjectHolding
+from fastapi import HTTPException
+from controllers.databaseController import get_users_collection, getProjectCollection, trade_session, normalize_phone
+from controllers.holdingsRepository import add_shares, find_holding, remove_shares, undo_add_shares, restore_shares
+from controllers.tradeLedger import record_trades, trade_entry
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+# A sell's conditional update misses when a concurrent trade changes the
+# holding between our read and our write; retry a few times before giving up.
+MAX_TRADE_ATTEMPTS = 3
+
+def validate_amount(amount):
+    """Reject a trade or deposit amount that is zero, negative or not finite with a 400"""
+    # A negative deposit would be an unchecked withdrawal; NaN would poison the balance
+    if not math.isfinite(amount) or amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+
+class TradeRejected(Exception):
+    """Raised inside a trade to abort it and report ``message`` to the caller"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+async def _reserve_shares(project_collection, share_id: str, amount: int, session):
+    # Only matches while enough shares remain, so concurrent buyers cannot oversell
+    return await project_collection.find_one_and_update(
+        {"project_id": share_id, "available_shares": {"$gte": amount}},
+        {"$inc": {"available_shares": -amount, "subscribers_accepted": 1}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
 
-async def buyShare(phone_num: int, share_id: str, amount: int):
-    user_collection = await get_users_collection()
-    existing_user = await user_collection.find_one({"phone_number": phone_num})
+async def _release_shares(project_collection, share_id: str, amount: int, session):
+    # Compensate a reservation when the buyer side of the trade fails.
+    # Inside a transaction the abort already undoes the reservation.
+    if session is None:
+        await project_collection.update_one(
+            {"project_id": share_id},
+            {"$inc": {"available_shares": amount, "subscribers_accepted": -1}}
+        )
 
-    project_collection = await getProjectCollection()
-    project = await project_collection.find_one({"project_id": share_id})
+async def _compensate(steps):
+    """Undo the applied half of a trade that failed outside a transaction.
+
+    Without a session the user, holding and project writes are separate
+    documents, so a failure part way through is rolled back by hand. Each
+    step is attempted even if an earlier one fails; failures are logged
+    and the original error is what the caller sees.
+    """
+    for description, step in steps:
+        try:
+            await step()
+        except PyMongoError as e:
+            print(f"Error compensating failed trade ({description}): {e}")
+
+
+async def _debit_buyer(user_collection, phone_num: int, total_cost: float, session):
+    """Debit the buyer in one update that only matches while the balance covers the cost"""
+    user = await user_collection.find_one_and_update(
+        {"phone_number": phone_num, "balance": {"$gte": total_cost}},
+        {"$inc": {"balance": -total_cost}},
+        projection={"balance": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if user is not None:
+        return user
 
+    existing_user = await user_collection.find_one({"phone_number": phone_num}, {"_id": 1}, session=session)
     if existing_user is None:
-        return {"message": "User not found"}
-    
-    if project is None:
-        return {"message": "Project not found"}
-
-    # Check if there are enough shares available
-    available_shares = project.get("available_shares", 0)
-    if available_shares < amount:
-        return {"message": "Not enough shares available"}
+        raise TradeRejected("User not found")
+    raise TradeRejected("Insufficient funds")
 
-    total_cost = project["project_subscription_cost"] * amount
-    if existing_user["balance"] < total_cost:
-        return {"message": "Insufficient funds"}
-
-    # Deduct total cost from user's balance
-    updated_balance = existing_user["balance"] - total_cost
-
-    # Extract earnings per share for profit calculations
-    earnings_per_share = project["earnings_per_share"]
-
-    # Check if user already has holdings in this project
-    active_stocks = existing_user.get("active_stocks", [])
-    existing_holding = next((holding for holding in active_stocks if holding["project_id"] == share_id), None)
-
-    if existing_holding:
-        # Update existing holding
-        existing_holding["num_shares"] += amount
-        existing_holding["total_investment"] += total_cost
-        existing_holding["profit"]["annual"] = earnings_per_share * existing_holding["num_shares"]
-        existing_holding["profit"]["monthly"] = earnings_per_share * existing_holding["num_shares"] / 12
-        existing_holding["profit"]["quarterly"] = earnings_per_share * existing_holding["num_shares"] / 4
-        existing_holding["carbon_offset"] += project["annual_carbon_offset"] / project["project_size"] * amount
-    else:
-        # Create new holding entry
-        new_holding = ProjectHolding(
-            project_id=project["project_id"],
-            num_shares=amount,
-            share_price=project["project_subscription_cost"],
-            total_investment=total_cost,
-            profit={
-                "monthly": earnings_per_share * amount / 12,  # Monthly revenue from project per share
-                "quarterly": earnings_per_share * amount / 4,  # Quarterly revenue
-                "annual": earnings_per_share * amount  # Annual revenue
-            },
-            carbon_offset=project["annual_carbon_offset"] / project["project_size"] * amount,
-            purchase_date=datetime.utcnow(),
-            projected_annual_return=project["expected_roi"],
-            dividend_yield=0.0,  
-            current_share_value=project["project_subscription_cost"]
-        )
-        active_stocks.append(new_holding.dict())
 
-    # Update project details: decrement available shares, increment active subscribers and subscribers accepted
-    updated_available_shares = available_shares - amount
-    updated_active_subscribers = project.get("active_subscribers", 0) + 1
-    updated_subscribers_accepted = project.get("subscribers_accepted", 0) + 1
+async def _buy(phone_num: int, share_id: str, amount: int, session):
+    user_collection = await get_users_collection()
+    project_collection = await getProjectCollection()
 
-    # Update user document
-    await user_collection.update_one(
-        {"phone_number": phone_num},
-        {
-            "$set": {
-                "balance": updated_balance,
-                "active_stocks": active_stocks
-            }
-        }
-    )
+    project = await _reserve_shares(project_collection, share_id, amount, session)
+    if project is None:
+        exists = await project_collection.find_one({"project_id": share_id}, {"_id": 1}, session=session)
+        raise TradeRejected("Not enough shares available" if exists else "Project not found")
 
-    # Update project document
-    await project_collection.update_one(
-        {"project_id": share_id},
-        {
-            "$set": {
-                "available_shares": updated_available_shares,
-                "active_subscribers": updated_active_subscribers,
-                "subscribers_accepted": updated_subscribers_accepted
-            }
-        }
-    )
+    total_cost = project["project_subscription_cost"] * amount
+    try:
+        user = await _debit_buyer(user_collection, phone_num, total_cost, session)
+    except TradeRejected:
+        await _release_shares(project_collection, share_id, amount, session)
+        raise
+
+    # Adding to the holding is a single upsert on its own small document
+    carbon_offset = project["annual_carbon_offset"] / project["project_size"] * amount
+    shares_added = False
+    try:
+        new_holding = await add_shares(phone_num, project, amount, total_cost, carbon_offset, session=session)
+        shares_added = True
+        if new_holding:
+            # A fresh holding means one more active subscriber for the project
+            await project_collection.update_one(
+                {"project_id": share_id},
+                {"$inc": {"active_subscribers": 1}},
+                session=session
+            )
+    except Exception:
+        if session is None:
+            steps = [("release shares", lambda: _release_shares(project_collection, share_id, amount, None))]
+            steps.append(("refund buyer", lambda: user_collection.update_one({"phone_number": phone_num}, {"$inc": {"balance": total_cost}})))
+            if shares_added:
+                steps.append(("remove holding", lambda: undo_add_shares(phone_num, project, amount, total_cost, carbon_offset)))
+            await _compensate(steps)
+        raise
+
+    updated_available_shares = project["available_shares"]
+
+    await record_trades([trade_entry("buy", phone_num, -total_cost, share_id, amount, project["project_subscription_cost"])], session)
 
     return {
         "message": "Shares purchased successfully",
         "amount_purchased": amount,
-        "updated_balance": updated_balance,
+        "updated_balance": user["balance"],
         "updated_available_shares": updated_available_shares
     }
 
-async def sellShare(phone_num: int, share_id: str, amount: int):
-    user_collection = await get_users_collection()
-    existing_user = await user_collection.find_one({"phone_number": phone_num})
+async def buyShare(phone_num: int, share_id: str, amount: int):
+    phone_num = normalize_phone(phone_num)
+    validate_amount(amount)
+    try:
+        async with trade_session() as session:
+            return await _buy(phone_num, share_id, amount, session)
+    except TradeRejected as e:
+        return {"message": e.message}
 
-    project_collection = await getProjectCollection()
-    project = await project_collection.find_one({"project_id": share_id})
 
-    if existing_user is None:
-        return {"message": "User not found"}
-    
-    if project is None:
-        return {"message": "Project not found"}
+async def _remove_from_holding(user_collection, phone_num: int, project: dict, amount: int, session):
+    """Take the shares out of the seller's holding, retrying if a concurrent trade moves it"""
+    for _ in range(MAX_TRADE_ATTEMPTS):
+        existing_holding = await find_holding(phone_num, project["project_id"], session=session)
+        if existing_holding is None:
+            existing_user = await user_collection.find_one({"phone_number": phone_num}, {"_id": 1}, session=session)
+            if existing_user is None:
+                raise TradeRejected("User not found")
+            raise TradeRejected("User does not own shares of this project")
 
-    # Check if user owns the specified share
-    active_stocks = existing_user.get("active_stocks", [])
-    existing_holding = next((holding for holding in active_stocks if holding["project_id"] == share_id), None)
+        # Check if user has enough shares to sell
+        if existing_holding["num_shares"] < amount:
+            raise TradeRejected("Insufficient shares to sell")
 
-    if existing_holding is None:
-        return {"message": "User does not own shares of this project"}
+        updated = await remove_shares(existing_holding, project, amount, session=session)
+        if updated is not None:
+            return existing_holding, updated["num_shares"] <= 0
 
-    # Check if user has enough shares to sell
-    if existing_holding["num_shares"] < amount:
-        return {"message": "Insufficient shares to sell"}
+    raise TradeRejected("Trade conflicted with concurrent updates, please retry")
+
+
+async def _sell(phone_num: int, share_id: str, amount: int, session):
+    user_collection = await get_users_collection()
+    project_collection = await getProjectCollection()
+
+    project = await project_collection.find_one({"project_id": share_id}, {"earnings_per_share": 1, "project_id": 1}, session=session)
+    if project is None:
+        raise TradeRejected("Project not found")
+
+    existing_holding, sold_out = await _remove_from_holding(user_collection, phone_num, project, amount, session)
 
     # Calculate earnings based on current share value and revenue per share
     total_earnings = existing_holding["current_share_value"] * amount
-    earnings_per_share = project["earnings_per_share"]
-
-    # Update the user's balance
-    updated_balance = existing_user["balance"] + total_earnings + (earnings_per_share * amount)
-
-    # Update or remove the holding
-    if existing_holding["num_shares"] == amount:
-        # Remove holding if all shares are sold
-        active_stocks = [holding for holding in active_stocks if holding["project_id"] != share_id]
-
-        # Decrement active subscribers in the project
-        updated_active_subscribers = max(project.get("active_subscribers", 1) - 1, 0)
-    else:
-        # Update holding details if only some shares are sold
-        existing_holding["num_shares"] -= amount
-        existing_holding["total_investment"] -= existing_holding["share_price"] * amount
-        existing_holding["profit"]["annual"] = earnings_per_share * existing_holding["num_shares"]
-        updated_active_subscribers = project.get("active_subscribers", 0)  # No change in subscribers if partial sale
-
-    # Update available shares in the project
-    updated_available_shares = project.get("available_shares", 0) + amount
-
-    # Update user document in the database
-    await user_collection.update_one(
-        {"phone_number": phone_num},
-        {
-            "$set": {
-                "balance": updated_balance,
-                "active_stocks": active_stocks
-            }
-        }
-    )
+    credit = total_earnings + (project["earnings_per_share"] * amount)
+    credited = False
+    try:
+        user = await user_collection.find_one_and_update(
+            {"phone_number": phone_num},
+            {"$inc": {"balance": credit}},
+            projection={"balance": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        credited = True
+
+        # Return the shares to the pool; a full exit also drops an active subscriber
+        project_update = {"available_shares": amount}
+        if sold_out:
+            project_update["active_subscribers"] = -1
+        updated_project = await project_collection.find_one_and_update(
+            {"project_id": share_id},
+            {"$inc": project_update},
+            projection={"available_shares": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+    except Exception:
+        if session is None:
+            steps = [("restore shares", lambda: restore_shares(existing_holding, project, amount))]
+            if credited:
+                steps.append(("take back credit", lambda: user_collection.update_one({"phone_number": phone_num}, {"$inc": {"balance": -credit}})))
+            await _compensate(steps)
+        raise
 
-    # Update project document
-    await project_collection.update_one(
-        {"project_id": share_id},
-        {
-            "$set": {
-                "available_shares": updated_available_shares,
-                "active_subscribers": updated_active_subscribers
-            }
-        }
-    )
+    await record_trades([trade_entry("sell", phone_num, credit, share_id, -amount, existing_holding["current_share_value"])], session)
 
     return {
         "message": "Shares sold successfully",
         "amount_sold": amount,
         "earnings_from_sale": total_earnings,
-        "updated_balance": updated_balance,
-        "updated_available_shares": updated_available_shares
+        "updated_balance": user["balance"],
+        "updated_available_shares": updated_project["available_shares"]
     }
 
+async def sellShare(phone_num: int, share_id: str, amount: int):
+    phone_num = normalize_phone(phone_num)
+    validate_amount(amount)
+    try:
+        async with trade_session() as session:
+            return await _sell(phone_num, share_id, amount, session)
+    except TradeRejected as e:
+        return {"message": e.message}
+
 
 async def addFunds(phone_num : int , amount : float):
 
+    phone_num = normalize_phone(phone_num)
+    validate_amount(amount)
     user_collection = await get_users_collection()
-    existing_user = await user_collection.find_one({"phone_number": phone_num})
+    existing_user = await user_collection.find_one_and_update(
+        {"phone_number": phone_num},
+        {"$inc": {"balance": amount}},
+        projection={"balance": 1},
+        return_document=ReturnDocument.AFTER
+    )
 
     if existing_user is None:
         return {"message": "User not found"}
-    
-    updated_balance = existing_user["balance"] + amount
 
-    await user_collection.update_one(
-        {"phone_number": phone_num},
-        {
-            "$set": {
-                "balance": updated_balance
-            }
-        }
-    )
+    await record_trades([trade_entry("deposit", phone_num, amount)])
 
     return {
         "message": "Funds added successfully",
         "amount_added": amount,
-        "updated_balance": updated_balance
+        "updated_balance": existing_user["balance"]
     }
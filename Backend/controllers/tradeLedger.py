@@ -0,0 +1,299 @@
+import asyncio
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import DESCENDING, ReplaceOne, ReturnDocument
+from pymongo.errors import PyMongoError
+from .databaseController import (
+    get_users_collection, get_holdings_collection, get_trades_collection,
+    get_snapshots_collection, get_ledger_state_collection, normalize_phone
+)
+
+# Every balance or share movement is appended to the trades journal as a small
+# insert-only document. A periodic job folds the journal into one snapshot per
+# user, so a user's balance and holdings are their snapshot plus the journal
+# entries after it. The user document keeps the live balance that trades check
+# atomically; the journal is the history, and snapshot + tail must agree with it.
+#
+# Users that existed before the journal need opening entries, written once with
+# trading paused:  python -m controllers.tradeLedger
+
+# Snapshots only fold entries older than this, so writes still in flight
+# (stamped a little earlier than they land) are never skipped
+SNAPSHOT_LAG = timedelta(seconds=float(os.getenv("TRADE_SNAPSHOT_LAG", 60)))
+EPOCH = datetime(1970, 1, 1)
+
+def trade_entry(kind: str, phone_num: int, cash: float, project_id: Optional[str] = None,
+                shares: int = 0, price: Optional[float] = None, ts: Optional[datetime] = None) -> dict:
+    """One journal entry: ``cash`` and ``shares`` are the changes to the user's balance and holding"""
+    entry = {"phone_number": phone_num, "ts": ts or datetime.utcnow(), "kind": kind, "cash": cash}
+    if project_id is not None:
+        entry.update({"project_id": project_id, "shares": shares, "price": price})
+    return entry
+
+async def record_trades(entries: List[dict], session=None):
+    """Append entries to the journal; batches go in one unordered insert.
+
+    Inside a transaction a failed append aborts the trade. Without one the
+    trade has already been applied, so the failure is only logged.
+    """
+    if not entries:
+        return
+    trades_collection = await get_trades_collection()
+    try:
+        if len(entries) == 1:
+            await trades_collection.insert_one(entries[0], session=session)
+        else:
+            await trades_collection.insert_many(entries, ordered=False, session=session)
+    except PyMongoError as e:
+        if session is not None:
+            raise
+        print(f"Error journaling {len(entries)} trades: {e}")
+
+
+def encode_history_cursor(entry: dict) -> str:
+    raw = json.dumps([entry["ts"].isoformat(), str(entry["_id"])]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        ts, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(ts), ObjectId(object_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def _serialize_entry(entry: dict) -> dict:
+    entry["_id"] = str(entry["_id"])
+    return entry
+
+async def getTradeHistory(phone_num, limit: int = 50, before: Optional[str] = None):
+    """Newest-first journal entries for a user, keyset-paginated on (ts, _id)"""
+    phone_num = normalize_phone(phone_num)
+    query = {"phone_number": phone_num}
+    if before:
+        ts, object_id = decode_history_cursor(before)
+        query["$or"] = [{"ts": {"$lt": ts}}, {"ts": ts, "_id": {"$lt": object_id}}]
+    try:
+        trades_collection = await get_trades_collection()
+        cursor = trades_collection.find(query, {"phone_number": 0}).sort([("ts", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1)
+        entries = await cursor.to_list(length=limit + 1)
+    except Exception as e:
+        print(f"Error fetching trade history: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching trade history")
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_history_cursor(entries[-1])
+    return {"trades": [_serialize_entry(entry) for entry in entries], "next_cursor": next_cursor}
+
+
+def _apply_entry(balance: float, holdings: Dict[str, int], entry: dict) -> float:
+    if entry.get("project_id") is not None:
+        holdings[entry["project_id"]] = holdings.get(entry["project_id"], 0) + entry.get("shares", 0)
+    return balance + entry["cash"]
+
+async def getLedgerPosition(phone_num):
+    """Balance and holdings derived from the user's snapshot plus the journal tail"""
+    phone_num = normalize_phone(phone_num)
+    try:
+        snapshots_collection = await get_snapshots_collection()
+        trades_collection = await get_trades_collection()
+        snapshot = await snapshots_collection.find_one({"phone_number": phone_num}) or {}
+        as_of = snapshot.get("ts", EPOCH)
+        balance = snapshot.get("balance", 0.0)
+        holdings = dict(snapshot.get("holdings", {}))
+        tail = 0
+        async for entry in trades_collection.find({"phone_number": phone_num, "ts": {"$gt": as_of}}):
+            balance = _apply_entry(balance, holdings, entry)
+            tail += 1
+    except Exception as e:
+        print(f"Error deriving ledger position: {e}")
+        raise HTTPException(status_code=500, detail="Error deriving ledger position")
+
+    return {
+        "phone_number": phone_num,
+        "balance": balance,
+        "holdings": {project_id: shares for project_id, shares in holdings.items() if shares},
+        "snapshot_ts": snapshot.get("ts"),
+        "tail_entries": tail
+    }
+
+
+async def snapshot_balances(batch_size: int = 500) -> int:
+    """Fold journal entries older than SNAPSHOT_LAG into the per-user snapshots.
+
+    Resumable: the cutoff is recorded before any snapshot is written and
+    reused if a run is interrupted, and a user whose snapshot already
+    reached the cutoff is skipped, so no entry is folded twice.
+    Returns the number of snapshots written.
+    """
+    state_collection = await get_ledger_state_collection()
+    trades_collection = await get_trades_collection()
+    snapshots_collection = await get_snapshots_collection()
+
+    state = await state_collection.find_one({"_id": "snapshots"}) or {}
+    previous = state.get("cutoff", EPOCH)
+    cutoff = state.get("pending") or datetime.utcnow() - SNAPSHOT_LAG
+    await state_collection.update_one({"_id": "snapshots"}, {"$set": {"pending": cutoff}}, upsert=True)
+
+    # One document per user with their cash total and per-project share totals
+    cursor = trades_collection.aggregate([
+        {"$match": {"ts": {"$gt": previous, "$lte": cutoff}}},
+        {"$group": {
+            "_id": {"phone_number": "$phone_number", "project_id": "$project_id"},
+            "cash": {"$sum": "$cash"},
+            "shares": {"$sum": "$shares"}
+        }},
+        {"$group": {
+            "_id": "$_id.phone_number",
+            "cash": {"$sum": "$cash"},
+            "projects": {"$push": {"project_id": "$_id.project_id", "shares": "$shares"}}
+        }}
+    ], batchSize=batch_size)
+
+    written = 0
+    batch = []
+    async for row in cursor:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            written += await _write_snapshots(snapshots_collection, batch, cutoff)
+            batch = []
+    if batch:
+        written += await _write_snapshots(snapshots_collection, batch, cutoff)
+
+    await state_collection.update_one({"_id": "snapshots"}, {"$set": {"cutoff": cutoff}, "$unset": {"pending": ""}})
+    return written
+
+async def _write_snapshots(snapshots_collection, rows: List[dict], cutoff: datetime) -> int:
+    snapshots = {
+        snapshot["phone_number"]: snapshot
+        async for snapshot in snapshots_collection.find({"phone_number": {"$in": [row["_id"] for row in rows]}})
+    }
+    operations = []
+    for row in rows:
+        snapshot = snapshots.get(row["_id"], {})
+        if snapshot.get("ts", EPOCH) >= cutoff:
+            continue  # Written by an interrupted run with the same cutoff
+        holdings = dict(snapshot.get("holdings", {}))
+        for project in row["projects"]:
+            if project.get("project_id") is not None:
+                holdings[project["project_id"]] = holdings.get(project["project_id"], 0) + project["shares"]
+        operations.append(ReplaceOne(
+            {"phone_number": row["_id"]},
+            {
+                "phone_number": row["_id"],
+                "ts": cutoff,
+                "balance": snapshot.get("balance", 0.0) + row["cash"],
+                "holdings": {project_id: shares for project_id, shares in holdings.items() if shares}
+            },
+            upsert=True
+        ))
+    if operations:
+        await snapshots_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+class LeasedJob:
+    """Runs ``job()`` every ``interval`` seconds in one app worker at a time"""
+
+    def __init__(self, name: str, interval: float, job: Callable[[], Awaitable[int]], label: str):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self.label = label
+        self.task: Optional[asyncio.Task] = None
+
+    async def _claim(self) -> bool:
+        # A lease on the state collection keeps several app workers from running the job at once
+        state_collection = await get_ledger_state_collection()
+        now = datetime.utcnow()
+        lease_id = f"{self.name}_lease"
+        try:
+            claimed = await state_collection.find_one_and_update(
+                {"_id": lease_id, "lease_until": {"$lt": now}},
+                {"$set": {"lease_until": now + timedelta(seconds=self.interval)}},
+                return_document=ReturnDocument.AFTER
+            )
+            if claimed is None:
+                await state_collection.insert_one({"_id": lease_id, "lease_until": now + timedelta(seconds=self.interval)})
+            return True
+        except PyMongoError:
+            # The lease exists and has not expired (or the insert lost a race)
+            return False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if await self._claim():
+                    written = await self.job()
+                    if written:
+                        print(f"Wrote {written} {self.label}")
+            except Exception as e:
+                print(f"Error writing {self.label}: {e}")
+
+    def start(self):
+        if self.interval > 0 and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+
+snapshot_job = LeasedJob("snapshots", float(os.getenv("TRADE_SNAPSHOT_INTERVAL", 300)), snapshot_balances, "balance snapshots")
+
+async def start_snapshot_job():
+    # TRADE_SNAPSHOT_INTERVAL=0 disables snapshots; balances then derive from the whole journal
+    snapshot_job.start()
+
+async def stop_snapshot_job():
+    await snapshot_job.stop()
+
+
+async def open_ledger_accounts(batch_size: int = 500) -> int:
+    """Write opening entries for users that have no journal entries yet.
+
+    Copies the current balance and holdings, so run it with trading paused,
+    once, when the journal is introduced. Returns the number of users opened.
+    """
+    user_collection = await get_users_collection()
+    holdings_collection = await get_holdings_collection()
+    trades_collection = await get_trades_collection()
+    opened = 0
+    ts = datetime.utcnow()
+
+    async for user in user_collection.find({}, {"phone_number": 1, "balance": 1}, batch_size=batch_size):
+        phone_num = user["phone_number"]
+        if await trades_collection.find_one({"phone_number": phone_num}, {"_id": 1}) is not None:
+            continue
+        entries = [trade_entry("opening", phone_num, user.get("balance", 0.0), ts=ts)]
+        async for holding in holdings_collection.find({"phone_number": phone_num}):
+            entries.append(trade_entry("opening", phone_num, 0.0, holding["project_id"], holding["num_shares"], holding["share_price"], ts=ts))
+        await trades_collection.insert_many(entries, ordered=False)
+        opened += 1
+    return opened
+
+
+if __name__ == "__main__":
+    from .databaseController import connect_to_database, close_database_connection
+
+    async def main():
+        await connect_to_database()
+        try:
+            print(f"Opened ledger accounts for {await open_ledger_accounts()} users")
+        finally:
+            await close_database_connection()
+
+    asyncio.run(main())
@@ -1,7 +1,10 @@
 from models.userSchema import user_schema
 from models.userSchema import User
 from fastapi import HTTPException
-from .databaseController import get_users_collection
+from pymongo.errors import DuplicateKeyError
+from .databaseController import get_users_collection, normalize_phone
+from .holdingsRepository import list_holdings, portfolio_pipeline
+from .projectCache import project_cache
 
 
 from bson import ObjectId
@@ -10,21 +13,20 @@ from fastapi import HTTPException
 async def create_user(phone_num: int, energy_consumption: float):
     try:
         user_collection = await get_users_collection()
-        existing_user = await user_collection.find_one({"phone_number": phone_num})
-        if existing_user:
-            raise HTTPException(status_code=400, detail="User with this phone number already exists")
-        
         user_dict = {
-            "phone_number": phone_num,
+            "phone_number": normalize_phone(phone_num),
             "energy_consumption": energy_consumption,
-            "active_stocks": [],
             "balance": 0
         }
-        
+
+        # The unique index on phone_number rejects duplicates, no lookup needed first
         result = await user_collection.insert_one(user_dict)
         user_dict["_id"] = str(result.inserted_id)  # Convert ObjectId to string
+        user_dict["active_stocks"] = []  # Holdings live in the holdings collection
         return user_dict
-    
+
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User with this phone number already exists")
     except HTTPException as http_err:
         raise http_err
     except Exception as e:
@@ -33,10 +35,12 @@ async def create_user(phone_num: int, energy_consumption: float):
 
 
 async def get_user_by_phone(phone_number: str):
+    phone_number = normalize_phone(phone_number)
     try:
         user_collection = await get_users_collection()
         user = await user_collection.find_one({"phone_number": phone_number})
         if user:
+            user["active_stocks"] = await list_holdings(phone_number)
             return user
         return None
     except Exception as e:
@@ -47,14 +51,65 @@ async def get_user_by_phone(phone_number: str):
 async def getHoldings(phone_num):
     
     user_collection = await get_users_collection()
-    existing_user = await user_collection.find_one({"phone_number": phone_num})
+    phone_num = normalize_phone(phone_num)
+    existing_user = await user_collection.find_one({"phone_number": phone_num}, {"_id": 1})
 
     if existing_user:
-        return existing_user["active_stocks"]
+        return await list_holdings(phone_num)
     else:
         raise HTTPException(status_code=404, detail="User not found")
-    
 
 
+# Per-project sums from the pipeline that are also added up into the totals
+PORTFOLIO_SUMS = ["num_shares", "total_investment", "current_value", "carbon_offset"]
+PROFIT_PERIODS = ["monthly", "quarterly", "annual"]
+
+async def getPortfolioSummary(phone_num):
+    """Totals and a per-project breakdown of a user's holdings, joined with live project fields"""
+    phone_num = normalize_phone(phone_num)
+    try:
+        user_collection = await get_users_collection()
+        rows = await user_collection.aggregate(portfolio_pipeline(phone_num)).to_list(length=None)
+        if not rows:
+            user = await user_collection.find_one({"phone_number": phone_num}, {"_id": 0, "balance": 1})
+            if user is None:
+                raise HTTPException(status_code=404, detail="User not found")
+            balance = user.get("balance", 0)
+        else:
+            balance = rows[0]["balance"]
 
+        # projectDetails lives in another database, out of $lookup's reach;
+        # the live fields come from the in-memory project catalog instead
+        projects = await project_cache.get_many([row["_id"] for row in rows])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error building portfolio summary: {e}")
+        raise HTTPException(status_code=500, detail="Error building portfolio summary")
+
+    breakdown = []
+    totals = {field: 0 for field in PORTFOLIO_SUMS + ["annual_earnings", "expected_annual_return"]}
+    totals["profit"] = {period: 0 for period in PROFIT_PERIODS}
+    for row in rows:
+        project = projects.get(row["_id"], {})
+        earnings_per_share = project.get("earnings_per_share", 0)
+        expected_roi = project.get("expected_roi", 0)
+        entry = {
+            "project_id": row["_id"],
+            "project_company": project.get("project_company"),
+            "project_location": project.get("project_location"),
+            **{field: row[field] for field in PORTFOLIO_SUMS},
+            "profit": {period: row[f"{period}_profit"] for period in PROFIT_PERIODS},
+            "earnings_per_share": earnings_per_share,
+            "expected_roi": expected_roi,
+            "annual_earnings": earnings_per_share * row["num_shares"],
+            "expected_annual_return": row["total_investment"] * expected_roi / 100
+        }
+        breakdown.append(entry)
+        for field in PORTFOLIO_SUMS + ["annual_earnings", "expected_annual_return"]:
+            totals[field] += entry[field]
+        for period in PROFIT_PERIODS:
+            totals["profit"][period] += entry["profit"][period]
+    totals["unrealized_gain"] = totals["current_value"] - totals["total_investment"]
 
+    return {"phone_number": phone_num, "balance": balance, "totals": totals, "projects": breakdown}
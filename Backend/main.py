@@ -1,9 +1,17 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
 from controllers.databaseController import connect_to_database, close_database_connection
-from routes import userRoutes, projectRoutes , transactionRoute , deviceInitRoute
+from controllers.inferenceEngine import start_inference_engine, stop_inference_engine
+from controllers.projectCache import start_project_cache, stop_project_cache
+from controllers.indexController import bootstrap_indexes, stop_index_bootstrap
+from controllers.recommendationController import start_recommendation_engine
+from controllers.modelRegistry import start_model_registry, stop_model_registry
+from controllers.tradeLedger import start_snapshot_job, stop_snapshot_job
+from controllers.dividendAccrual import start_accrual_job, stop_accrual_job
+from controllers.metrics import start_request_timing, finish_request_timing, server_timing_enabled, server_timing_header
+from routes import userRoutes, projectRoutes , transactionRoute , deviceInitRoute , recommendationRoute , modelRoute , metricsRoute , healthRoute
 
 app = FastAPI()
 
@@ -15,13 +23,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-#Database Connection Handling
+#Request instrumentation: per-route latency, Mongo round trips and inference time
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    timing = start_request_timing()
+    try:
+        response = await call_next(request)
+    except Exception:
+        route = request.scope.get("route")
+        finish_request_timing(timing, request.method, route.path if route else "unmatched", 500)
+        raise
+    # Label by route template, not raw path, to keep the series count bounded
+    route = request.scope.get("route")
+    elapsed = finish_request_timing(timing, request.method, route.path if route else "unmatched", response.status_code)
+    if server_timing_enabled():
+        response.headers["Server-Timing"] = server_timing_header(timing, elapsed)
+    return response
+
+#Database Connection and Model Handling
 @app.on_event("startup")
 async def startup_event():
     await connect_to_database()
+    await bootstrap_indexes()
+    await start_project_cache()
+    await start_model_registry()
+    await start_inference_engine()
+    await start_recommendation_engine()
+    await start_snapshot_job()
+    await start_accrual_job()
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await stop_accrual_job()
+    await stop_snapshot_job()
+    await stop_inference_engine()
+    await stop_model_registry()
+    await stop_project_cache()
+    await stop_index_bootstrap()
     await close_database_connection()
 
 
@@ -30,6 +68,10 @@ app.include_router(userRoutes.router)
 app.include_router(projectRoutes.router)
 app.include_router(transactionRoute.router)
 app.include_router(deviceInitRoute.router)
+app.include_router(recommendationRoute.router)
+app.include_router(modelRoute.router)
+app.include_router(metricsRoute.router)
+app.include_router(healthRoute.router)
 
 @app.get("/")
 async def root():
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 import random
 
 class Project(BaseModel):
@@ -26,6 +26,8 @@ class Project(BaseModel):
     active_subscribers: int  # Number of active subscribers
 
 class ProjectHolding(BaseModel):
+    # One document per (phone_number, project_id) in the users.holdings collection
+    phone_number: Optional[int] = None
     project_id: str
     num_shares: int
     share_price: float  # Initial share price
@@ -34,4 +36,7 @@ class ProjectHolding(BaseModel):
     carbon_offset: float  # Carbon offset per share
     purchase_date: datetime
     projected_annual_return: float  # Expected annual return for the holding
+    dividend_yield: float = 0.0  # Dividend yield paid on the holding
+    dividends_paid: float = 0.0  # Total dividends credited by the accrual job
+    last_dividend: float = 0.0  # Dividend credited in the latest accrual period
     current_share_value: float  # Current market value per share
\ No newline at end of file
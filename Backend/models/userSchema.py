@@ -4,7 +4,7 @@ from typing import List
 
 
 class User(BaseModel):
-    phone_number: str
+    phone_number: int
     energy_consumption : float
     active_stocks : List[ProjectHolding] = []
     balance : float
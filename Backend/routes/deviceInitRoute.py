@@ -1,6 +1,12 @@
-from fastapi import APIRouter, Query
-from controllers.iotpred import predict_consumption
-from controllers.projectController import getAllProjects, getProjectsByLocation
+import io
+import json
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from controllers.inferenceEngine import predict_consumption_async
+from controllers.iotpred import predict_consumption_batch, iter_consumption_rows
+from controllers.admissionControl import admit
 
 
 
@@ -12,6 +18,49 @@ router = APIRouter(
 
 @router.post("/init-devices")
 async def init_device(rooms : int = Query(), bulbs : int = Query(), fans : int = Query(), ovens : int = Query(), washing_machines : int = Query(), acs : int = Query()):
-    return predict_consumption(rooms, bulbs, fans, ovens, washing_machines, acs)
-    
+    return await predict_consumption_async(rooms, bulbs, fans, ovens, washing_machines, acs)
 
+def _read_csv(data: bytes) -> pd.DataFrame:
+    try:
+        return pd.read_csv(io.BytesIO(data))
+    except pd.errors.EmptyDataError:
+        raise HTTPException(status_code=422, detail="The CSV upload is empty")
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=422, detail=f"Could not parse the CSV upload: {e}")
+
+async def _read_devices(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=422, detail="Expected a CSV upload in the 'file' field")
+        return _read_csv(await upload.read())
+    if content_type.startswith("text/csv"):
+        return _read_csv(await request.body())
+    try:
+        devices = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid JSON body")
+    if not isinstance(devices, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array of device configurations")
+    return devices
+
+@router.post("/init-devices/batch", dependencies=[Depends(admit("init-devices-batch"))])
+async def init_devices_batch(request: Request):
+    """Predict consumption for a JSON array or CSV upload of device configurations"""
+    devices = await _read_devices(request)
+    daily_kwh, monthly_kwh, monthly_cost = await run_in_threadpool(predict_consumption_batch, devices)
+
+    def stream():
+        yield "["
+        first = True
+        for chunk in iter_consumption_rows(daily_kwh, monthly_kwh, monthly_cost):
+            body = json.dumps(chunk)[1:-1]
+            if not body:
+                continue
+            yield body if first else "," + body
+            first = False
+        yield "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
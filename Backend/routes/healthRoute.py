@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from controllers.databaseController import database_health
+from controllers.admissionControl import admission_stats
+from controllers.idempotency import idempotency_cache
+
+
+
+router = APIRouter(
+    tags=["health"],
+    responses={404: {"description": "Not found"}}
+)
+
+@router.get("/health")
+async def get_health():
+    # 503 until Mongo answers a ping, so load balancers hold traffic back
+    health = await database_health()
+    health["admission"] = admission_stats()
+    health["idempotency"] = idempotency_cache.stats()
+    return JSONResponse(health, status_code=200 if health["status"] == "ok" else 503)
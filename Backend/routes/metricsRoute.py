@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from controllers.metrics import render_metrics
+
+
+
+router = APIRouter(
+    tags=["metrics"],
+    responses={404: {"description": "Not found"}}
+)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,20 @@
+from typing import Optional
+from fastapi import APIRouter, Query
+from controllers.modelRegistry import activateModel, getModelStats
+
+
+
+router = APIRouter(
+    tags=["models"],
+    responses={404: {"description": "Not found"}}
+)
+
+@router.get("/models")
+async def get_models():
+    # Versions on disk plus load time, size and latency of the resident ones
+    return getModelStats()
+
+@router.post("/models/{name}/activate")
+async def activate_model(name : str, version : Optional[str] = Query(None)):
+    # Hot-swaps to the newest artifact unless a version is given
+    return await activateModel(name, version)
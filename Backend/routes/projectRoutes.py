@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Query
-from controllers.projectController import getAllProjects, getProjectsByLocation
+import os
+from typing import Optional
+from fastapi import APIRouter, Query, Request, Response
+from controllers.projectController import getAllProjectsEncoded, getProjectsByLocationEncoded, getProjectsPage, getProjectCacheStats
 
 
 
@@ -9,11 +11,42 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
+cache_control = f"public, max-age={int(os.getenv('PROJECT_LIST_MAX_AGE', 5))}"
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/ prefixed tags still match
+    return any(tag == etag or tag == "W/" + etag for tag in tags)
+
+def _cached_json(request: Request, body: bytes, etag: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _fields(fields: Optional[str]):
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+# Without limit/after/fields the full list is served from the catalog cache;
+# with any of them the page is fetched from Mongo using the compound indexes.
+
 @router.get("/get-all-projects")
-async def get_all_projects():
-    return await getAllProjects()
+async def get_all_projects(request: Request, limit: Optional[int] = Query(None, ge=1, le=200), after: Optional[str] = Query(None), fields: Optional[str] = Query(None)):
+    if limit is not None or after is not None or fields is not None:
+        return await getProjectsPage(None, limit or 50, after, _fields(fields))
+    body, etag = await getAllProjectsEncoded()
+    return _cached_json(request, body, etag)
 
 @router.get("/get-projects-by-location")
-async def get_projects_by_location(location: str = Query()):
-    return await getProjectsByLocation(location)
+async def get_projects_by_location(request: Request, location: str = Query(), limit: Optional[int] = Query(None, ge=1, le=200), after: Optional[str] = Query(None), fields: Optional[str] = Query(None)):
+    if limit is not None or after is not None or fields is not None:
+        return await getProjectsPage(location, limit or 50, after, _fields(fields))
+    body, etag = await getProjectsByLocationEncoded(location)
+    return _cached_json(request, body, etag)
 
+@router.get("/project-cache-stats")
+async def project_cache_stats():
+    return getProjectCacheStats()
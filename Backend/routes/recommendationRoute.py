@@ -0,0 +1,21 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from controllers.recommendationController import recommendProject, predictGeneration
+from controllers.admissionControl import admit
+
+
+
+router = APIRouter(
+    tags=["recommendations"],
+    responses={404: {"description": "Not found"}}
+)
+
+@router.get("/recommend-project", dependencies=[Depends(admit("recommend-project"))])
+async def recommend_project(monthly_consumption : float = Query(), top_k : Optional[int] = Query(None, ge=1, le=50), location : Optional[str] = Query(None), min_roi : Optional[float] = Query(None), max_payback_years : Optional[float] = Query(None)):
+    # Any of top_k or the filters switches the response to a ranked list
+    return await recommendProject(monthly_consumption, top_k, location, min_roi, max_payback_years)
+
+@router.get("/predict-generation")
+async def predict_generation(panel_size : float = Query(gt=0), panel_capacity : float = Query(gt=0), panel_efficiency : float = Query(gt=0, le=100), inverter_efficiency : float = Query(gt=0, le=100), sunlight_hours : float = Query(gt=0, le=24), monthly_generation : List[float] = Query(), location : Optional[str] = Query(None)):
+    # Annual kWh from the registry's solar_model; monthly_generation is given twelve times, January first
+    return await predictGeneration(panel_size, panel_capacity, panel_efficiency, inverter_efficiency, sunlight_hours, monthly_generation, location)
@@ -1,6 +1,10 @@
+from typing import Optional
 from uuid import UUID
-from fastapi import APIRouter, Query
-from controllers.stocksTransactionController import addFunds, buyShare, sellShare
+from fastapi import APIRouter, Depends, Header, Query, Response
+from controllers.stocksTransactionController import addFunds
+from controllers.orderQueue import submit_order
+from controllers.admissionControl import admit
+from controllers.idempotency import idempotent
 
 
 
@@ -9,14 +13,30 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
-@router.post("/buy-share")
-async def get_all_projects(phone_num : int = Query() , share_id : str = Query(),amount : int = Query()):
-    return await buyShare(phone_num , share_id, amount)
+def _replayed(response: Response, result_and_replayed):
+    # Retries with an Idempotency-Key get the first request's result back
+    result, replayed = result_and_replayed
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
 
-@router.post("/sell-share")
-async def get_projects_by_location(phone_num : int = Query() , share_id : str = Query()  , amount : int = Query()):
-    return await sellShare(phone_num , share_id, amount)
+@router.post("/buy-share", dependencies=[Depends(admit("buy-share", rate_limited=True))])
+async def get_all_projects(response : Response, phone_num : int = Query() , share_id : str = Query(),amount : int = Query(), idempotency_key : Optional[str] = Header(None, alias="Idempotency-Key")):
+    return _replayed(response, await idempotent(
+        "buy-share", phone_num, idempotency_key, {"share_id": share_id, "amount": amount},
+        lambda: submit_order("buy", phone_num , share_id, amount)
+    ))
 
-@router.post("/add-funds")
-async def addFundsInWallet(phone_num : int = Query() , amount : float = Query(), ):
-    return await addFunds(phone_num , amount)
+@router.post("/sell-share", dependencies=[Depends(admit("sell-share", rate_limited=True))])
+async def get_projects_by_location(response : Response, phone_num : int = Query() , share_id : str = Query()  , amount : int = Query(), idempotency_key : Optional[str] = Header(None, alias="Idempotency-Key")):
+    return _replayed(response, await idempotent(
+        "sell-share", phone_num, idempotency_key, {"share_id": share_id, "amount": amount},
+        lambda: submit_order("sell", phone_num , share_id, amount)
+    ))
+
+@router.post("/add-funds", dependencies=[Depends(admit("add-funds", rate_limited=True))])
+async def addFundsInWallet(response : Response, phone_num : int = Query() , amount : float = Query(), idempotency_key : Optional[str] = Header(None, alias="Idempotency-Key")):
+    return _replayed(response, await idempotent(
+        "add-funds", phone_num, idempotency_key, {"amount": amount},
+        lambda: addFunds(phone_num , amount)
+    ))
@@ -1,5 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query
-from controllers.userController import create_user, get_user_by_phone, getHoldings
+from controllers.userController import create_user, get_user_by_phone, getHoldings, getPortfolioSummary
+from controllers.tradeLedger import getTradeHistory, getLedgerPosition
+from typing import Optional
 from models.userSchema import User
 
 
@@ -17,6 +19,21 @@ async def create_new_user(phone_num : int = Query() , energy_consumption : float
 async def get_all_projects(phone_num : int = Query()):
     return await getHoldings(phone_num)
 
+@router.get("/portfolio-summary")
+async def portfolio_summary(phone_num : int = Query()):
+    # Totals and per-project breakdown in one small response
+    return await getPortfolioSummary(phone_num)
+
+@router.get("/trade-history")
+async def trade_history(phone_num : int = Query(), limit : int = Query(50, ge=1, le=500), before : Optional[str] = Query(None)):
+    # Newest first; pass next_cursor back as `before` for the next page
+    return await getTradeHistory(phone_num, limit, before)
+
+@router.get("/ledger-balance")
+async def ledger_balance(phone_num : int = Query()):
+    # Balance and holdings rebuilt from the latest snapshot plus newer journal entries
+    return await getLedgerPosition(phone_num)
+
 
 
 @router.get("/get-user", response_model=User)
@@ -1,66 +1,267 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestRegressor
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+MONTH_COLUMNS = [f'Month_{i}_Energy_kWh' for i in range(1, 13)]
+
+class _ScoringArrays(NamedTuple):
+    """Per-project arrays scoring and filtering read, published together.
+    
+    A predictor swaps in a new instance in one assignment and every call works
+    from the one instance it read first, so it never mixes arrays of two
+    different dataset sizes.
+    """
+    annual_energy: np.ndarray
+    base_scores: np.ndarray
+    roi: np.ndarray
+    payback_years: np.ndarray
+    location_masks: Dict[str, np.ndarray]
+
+def iter_installation_chunks(path: str, chunk_size: int = 100_000) -> Iterator[pd.DataFrame]:
+    """Read an installation dataset (CSV or Parquet) ``chunk_size`` rows at a time"""
+    if path.endswith(('.parquet', '.pq')):
+        # Parquet support needs pyarrow; CSV datasets work without it
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
 
 class SolarPredictor:
-    def __init__(self, csv_path: str):
-        """Initialize the predictor with CSV data"""
+    # Weights of the individual scores in the final project score
+    weights = {
+        'generation': 0.3,
+        'efficiency': 0.2,
+        'stability': 0.2,
+        'roi': 0.3
+    }
+
+    # Simulated energy sale rate range (per kWh) and base cost (per kW) by location.
+    # Rates are drawn in this order, so reordering changes the seeded features.
+    sale_rate_ranges = {
+        'Gujarat': (5.5, 6.2),
+        'Delhi': (6.8, 7.5),
+        'Rajasthan': (5.2, 6.0),
+        'Kolkata': (6.5, 7.2),
+        'Hyderabad': (6.0, 6.8),
+        'Chennai': (6.2, 7.0),
+        'Mumbai': (6.5, 7.3)
+    }
+    location_base_costs = {
+        'Gujarat': 42000,
+        'Delhi': 48000,
+        'Rajasthan': 40000,
+        'Kolkata': 46000,
+        'Hyderabad': 44000,
+        'Chennai': 45000,
+        'Mumbai': 50000
+    }
+
+    # Bump when the derived feature table changes so stale caches are ignored
+    cache_format = 2
+
+    def __init__(self, csv_path: str, cache_dir: Optional[str] = None, use_cache: bool = True,
+                 seed: Optional[int] = None, result_cache_size: int = 1024, consumption_precision: int = 0):
+        """Initialize the predictor with CSV data
+        
+        Args:
+            csv_path: Solar installation dataset
+            cache_dir: Where the derived feature table is cached; defaults to
+                $SOLAR_CACHE_DIR or a .solar_cache directory next to the CSV
+            use_cache: Set to False to always re-derive features from the CSV
+            seed: Seed for the simulated sale rates and cost factors; defaults to
+                $SOLAR_SEED or 42 so every process derives the same features
+            result_cache_size: Number of best projects predict_and_analyze keeps (LRU)
+            consumption_precision: Decimals monthly consumption is rounded to
+                for predict_and_analyze's cache key only
+        """
         self.scaler = StandardScaler()
+        self.use_cache = use_cache
+        self.seed = seed if seed is not None else int(os.getenv('SOLAR_SEED', 42))
+        self.result_cache_size = result_cache_size
+        self.consumption_precision = consumption_precision
+        self._results: OrderedDict = OrderedDict()
+        self._results_lock = threading.Lock()
+        self.cache_dir = cache_dir or os.getenv('SOLAR_CACHE_DIR') or os.path.join(
+            os.path.dirname(os.path.abspath(csv_path)), '.solar_cache'
+        )
         self.load_data(csv_path)
         
     def load_data(self, csv_path: str):
-        """Load and process the CSV data"""
+        """Load and process the CSV data, reusing the cached feature table when the CSV is unchanged"""
         try:
-            self.projects_df = pd.read_csv(csv_path)
-            month_columns = [f'Month_{i}_Energy_kWh' for i in range(1, 13)]
-            
-            # Calculate additional features
-            self.projects_df['Summer_Generation'] = self.projects_df[[f'Month_{i}_Energy_kWh' for i in [5,6,7,8]]].mean(axis=1)
-            self.projects_df['Winter_Generation'] = self.projects_df[[f'Month_{i}_Energy_kWh' for i in [11,12,1,2]]].mean(axis=1)
-            self.projects_df['Generation_Variance'] = self.projects_df[month_columns].var(axis=1)
+            self.dataset_version = self._dataset_version(csv_path)
+            with self._results_lock:
+                self._results.clear()
             
-            # Add location-based rates
-            location_rates = {
-                'Gujarat': np.random.uniform(5.5, 6.2),
-                'Delhi': np.random.uniform(6.8, 7.5),
-                'Rajasthan': np.random.uniform(5.2, 6.0),
-                'Kolkata': np.random.uniform(6.5, 7.2),
-                'Hyderabad': np.random.uniform(6.0, 6.8),
-                'Chennai': np.random.uniform(6.2, 7.0),
-                'Mumbai': np.random.uniform(6.5, 7.3)
-            }
-            
-            self.projects_df['Energy_Sale_Rate'] = self.projects_df['Location'].map(
-                lambda x: location_rates.get(x, 6.0)
-            )
-            
-            # Calculate costs
-            location_base_costs = {
-                'Gujarat': 42000,
-                'Delhi': 48000,
-                'Rajasthan': 40000,
-                'Kolkata': 46000,
-                'Hyderabad': 44000,
-                'Chennai': 45000,
-                'Mumbai': 50000
-            }
+            cached = self._load_cached(csv_path) if self.use_cache else None
+            if cached is not None:
+                self.projects_df = cached
+                self._precompute_scores()
+                return
             
-            base_costs = self.projects_df['Location'].map(lambda x: location_base_costs.get(x, 45000))
-            size_factor = 1 - (0.1 * np.log1p(self.projects_df['Panel_Capacity_kW']) / np.log1p(100))
-            efficiency_factor = 1 + (self.projects_df['Panel_Efficiency_Percent'] - 15) / 100
-            random_factor = np.random.uniform(0.925, 1.075, len(self.projects_df))
+            self.projects_df = pd.read_csv(csv_path)
+            rng = np.random.default_rng(self.seed)
+            self._derive_features(self.projects_df, self._draw_sale_rates(rng), rng)
             
-            self.projects_df['Cost_per_kW'] = base_costs * size_factor * efficiency_factor * random_factor
-            self.projects_df['Total_Cost'] = self.projects_df['Panel_Capacity_kW'] * self.projects_df['Cost_per_kW']
-            self.projects_df['Annual_Revenue'] = self.projects_df['Total_Annual_Energy_kWh'] * self.projects_df['Energy_Sale_Rate']
-            self.projects_df['ROI'] = (self.projects_df['Annual_Revenue'] / self.projects_df['Total_Cost']) * 100
+            if self.use_cache:
+                self._save_cached(csv_path)
+            self._precompute_scores()
             
         except Exception as e:
             print(f"Error loading data: {str(e)}")
             raise
     
+    def _draw_sale_rates(self, rng: np.random.Generator) -> Dict[str, float]:
+        """Energy sale rate of each location, drawn from the seeded generator"""
+        return {location: rng.uniform(low, high) for location, (low, high) in self.sale_rate_ranges.items()}
+    
+    def _derive_features(self, df: pd.DataFrame, location_rates: Dict[str, float], rng: np.random.Generator):
+        """Add the derived feature columns to ``df`` in place.
+        
+        Row-wise, so it gives the same features whether the dataset is derived
+        whole or in consecutive chunks sharing one generator.
+        """
+        # Calculate additional features
+        df['Summer_Generation'] = df[[f'Month_{i}_Energy_kWh' for i in [5,6,7,8]]].mean(axis=1)
+        df['Winter_Generation'] = df[[f'Month_{i}_Energy_kWh' for i in [11,12,1,2]]].mean(axis=1)
+        df['Generation_Variance'] = df[MONTH_COLUMNS].var(axis=1)
+        
+        # Add location-based rates
+        df['Energy_Sale_Rate'] = df['Location'].map(lambda x: location_rates.get(x, 6.0))
+        
+        # Calculate costs
+        base_costs = df['Location'].map(lambda x: self.location_base_costs.get(x, 45000))
+        size_factor = 1 - (0.1 * np.log1p(df['Panel_Capacity_kW']) / np.log1p(100))
+        efficiency_factor = 1 + (df['Panel_Efficiency_Percent'] - 15) / 100
+        random_factor = rng.uniform(0.925, 1.075, len(df))
+        
+        df['Cost_per_kW'] = base_costs * size_factor * efficiency_factor * random_factor
+        df['Total_Cost'] = df['Panel_Capacity_kW'] * df['Cost_per_kW']
+        df['Annual_Revenue'] = df['Total_Annual_Energy_kWh'] * df['Energy_Sale_Rate']
+        df['ROI'] = (df['Annual_Revenue'] / df['Total_Cost']) * 100
+    
+    def _dataset_version(self, csv_path: str) -> str:
+        """Identifies the derived features: the CSV content plus the seed"""
+        digest = hashlib.sha256()
+        with open(csv_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return f"{digest.hexdigest()[:32]}-s{self.seed}"
+    
+    def _cache_path(self, csv_path: str) -> str:
+        """Cache directory for this exact CSV content and seed"""
+        return os.path.join(self.cache_dir, f"v{self.cache_format}-{self.dataset_version}")
+    
+    def _load_cached(self, csv_path: str) -> Optional[pd.DataFrame]:
+        """Load the feature table from its .npy bundle, memory-mapped so workers share the pages"""
+        path = self._cache_path(csv_path)
+        try:
+            with open(os.path.join(path, 'columns.json')) as f:
+                columns = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        data = {}
+        for i, column in enumerate(columns):
+            values = np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r')
+            if column['categories'] is not None:
+                # Text columns are stored as category codes
+                values = pd.Categorical.from_codes(values, column['categories'])
+            data[column['name']] = values
+        return pd.DataFrame(data, copy=False)
+    
+    def _save_cached(self, csv_path: str):
+        """Write the feature table as one .npy file per column; a failed write only costs the cache"""
+        path = self._cache_path(csv_path)
+        if os.path.isdir(path):
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = tempfile.mkdtemp(dir=self.cache_dir)
+            columns = []
+            for i, name in enumerate(self.projects_df.columns):
+                series = self.projects_df[name]
+                categories = None
+                if series.dtype == object:
+                    categorical = pd.Categorical(series)
+                    categories = categorical.categories.tolist()
+                    values = categorical.codes
+                else:
+                    values = series.to_numpy()
+                np.save(os.path.join(tmp, f'{i}.npy'), np.ascontiguousarray(values))
+                columns.append({'name': name, 'categories': categories})
+            with open(os.path.join(tmp, 'columns.json'), 'w') as f:
+                json.dump(columns, f)
+            # Publish atomically; if another worker got there first keep theirs
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)
+        except OSError as e:
+            print(f"Error caching features: {str(e)}")
+    
+    def _score_columns(self, df: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """Per-project arrays scoring and filtering need, none of which depend on consumption"""
+        efficiency_score = (df['Panel_Efficiency_Percent'] + df['Inverter_Efficiency_Percent']).to_numpy(dtype=np.float64) / 200
+        stability_score = 1 / (1 + df['Generation_Variance'].to_numpy(dtype=np.float64) / df['Total_Annual_Energy_kWh'].to_numpy(dtype=np.float64))
+        roi_score = df['ROI'].to_numpy(dtype=np.float64) / 100
+        
+        return {
+            'annual_energy': df['Total_Annual_Energy_kWh'].to_numpy(dtype=np.float64),
+            'base_scores': (
+                self.weights['efficiency'] * efficiency_score +
+                self.weights['stability'] * stability_score +
+                self.weights['roi'] * roi_score
+            ),
+            # Filter columns used by the top-k recommendations
+            'roi': df['ROI'].to_numpy(dtype=np.float64),
+            'payback_years': (df['Total_Cost'] / df['Annual_Revenue']).to_numpy(dtype=np.float64)
+        }
+    
+    def _precompute_scores(self):
+        """Cache the score components that do not depend on consumption"""
+        df = self.projects_df
+        locations = pd.Categorical(df['Location'])
+        self.scoring = _ScoringArrays(
+            **self._score_columns(df),
+            location_masks={location: locations.codes == code for code, location in enumerate(locations.categories)}
+        )
+    
+    def filter_mask(self, location: Optional[str] = None, min_roi: Optional[float] = None,
+                    max_payback_years: Optional[float] = None, scoring: Optional[_ScoringArrays] = None) -> np.ndarray:
+        """Boolean mask over the projects passing all given filters"""
+        scoring = scoring or self.scoring
+        if location is not None:
+            mask = scoring.location_masks.get(location)
+            if mask is None:
+                return np.zeros(len(scoring.annual_energy), dtype=bool)
+            mask = mask.copy()
+        else:
+            mask = np.ones(len(scoring.annual_energy), dtype=bool)
+        if min_roi is not None:
+            mask &= scoring.roi >= min_roi
+        if max_payback_years is not None:
+            mask &= scoring.payback_years <= max_payback_years
+        return mask
+    
+    def score_projects(self, annual_consumptions: np.ndarray, scoring: Optional[_ScoringArrays] = None) -> np.ndarray:
+        """Final scores for each consumption (rows) against each project (columns)"""
+        scoring = scoring or self.scoring
+        coverage_ratio = scoring.annual_energy[np.newaxis, :] / annual_consumptions[:, np.newaxis]
+        generation_score = 1 / (1 + np.abs(coverage_ratio - 1))
+        return self.weights['generation'] * generation_score + scoring.base_scores[np.newaxis, :]
+    
     def calculate_optimal_shares(self, project: Dict[str, Any], annual_consumption: float) -> Dict[str, Any]:
         """Calculate optimal share distribution for a project"""
         min_shares_needed = np.ceil(annual_consumption / (project['Total_Annual_Energy_kWh'] / 1000))
@@ -94,38 +295,107 @@ class SolarPredictor:
             monthly_consumption: Monthly energy consumption in kWh
             
         Returns:
-            Dictionary containing all project analysis and recommendations
+            Dictionary containing all project analysis and recommendations.
+            The best project is chosen for the consumption rounded to
+            ``consumption_precision``, so it depends only on the cache key and
+            every process picks the same one; the breakdown is computed from
+            the exact consumption and each caller gets its own dict.
         """
-        annual_consumption = monthly_consumption * 12
+        monthly_consumption = float(monthly_consumption)
+        key = (self.dataset_version, round(monthly_consumption, self.consumption_precision))
+        with self._results_lock:
+            best_project = self._results.get(key)
+            if best_project is not None:
+                self._results.move_to_end(key)
         
-        # Calculate consumption coverage ratio
-        coverage_ratio = self.projects_df['Total_Annual_Energy_kWh'] / annual_consumption
+        if best_project is None:
+            # Scored with the key's consumption, not this caller's, so the cached
+            # choice does not depend on which caller filled the entry first.
+            # Only the generation score depends on consumption; the rest is precomputed
+            final_score = self.score_projects(np.array([key[1] * 12], dtype=np.float64))[0]
+            best_project = self._project_row(int(np.argmax(final_score)))
+            with self._results_lock:
+                self._results[key] = best_project
+                if len(self._results) > self.result_cache_size:
+                    self._results.popitem(last=False)
         
-        # Calculate scores
-        generation_score = 1 / (1 + np.abs(coverage_ratio - 1))
-        efficiency_score = (self.projects_df['Panel_Efficiency_Percent'] + 
-                          self.projects_df['Inverter_Efficiency_Percent']) / 200
-        stability_score = 1 / (1 + self.projects_df['Generation_Variance'] / self.projects_df['Total_Annual_Energy_kWh'])
-        roi_score = self.projects_df['ROI'] / 100
-        
-        # Calculate final score
-        weights = {
-            'generation': 0.3,
-            'efficiency': 0.2,
-            'stability': 0.2,
-            'roi': 0.3
-        }
+        # Fresh lists and dicts on every call, so callers cannot change what others get
+        return self._analyze_project(best_project, monthly_consumption)
+    
+    def predict_top_k(self, monthly_consumption: float, top_k: int = 5, location: Optional[str] = None,
+                      min_roi: Optional[float] = None, max_payback_years: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Predict and analyze the K best projects for a monthly consumption
         
-        final_score = (
-            weights['generation'] * generation_score +
-            weights['efficiency'] * efficiency_score +
-            weights['stability'] * stability_score +
-            weights['roi'] * roi_score
-        )
+        Args:
+            monthly_consumption: Monthly energy consumption in kWh
+            top_k: Number of projects to return
+            location: Only consider projects in this location
+            min_roi: Only consider projects with at least this ROI (%)
+            max_payback_years: Only consider projects paying back within this many years
+            
+        Returns:
+            Up to ``top_k`` results in the predict_and_analyze format, best first,
+            each with its 'score'
+        """
+        if top_k <= 0:
+            return []
+        # Scores and filters must come from the same published arrays
+        scoring = self.scoring
+        final_score = self.score_projects(np.array([monthly_consumption * 12], dtype=np.float64), scoring)[0]
         
-        # Get best project
-        best_idx = final_score.idxmax()
-        best_project = self.projects_df.iloc[best_idx]
+        candidates = np.flatnonzero(self.filter_mask(location, min_roi, max_payback_years, scoring))
+        scores = final_score[candidates]
+        if top_k < len(candidates):
+            # Partial sort: only the K best need to be found, not ordered
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(candidates))
+        # Order the K winners by score, ties broken by row order like argmax
+        best = best[np.lexsort((candidates[best], -scores[best]))]
+        
+        results = []
+        for i in best.tolist():
+            result = self._analyze_project(self._project_row(int(candidates[i])), monthly_consumption)
+            result['score'] = float(scores[i])
+            results.append(result)
+        return results
+    
+    def predict_and_analyze_many(self, consumptions: Sequence[float], chunk_size: int = 1024) -> List[Dict[str, Any]]:
+        """
+        Predict and analyze the best project for many monthly consumptions at once
+        
+        Scores are computed as one (consumers x projects) broadcast per chunk of
+        ``chunk_size`` consumers, which bounds the size of the score matrix.
+        
+        Args:
+            consumptions: Monthly energy consumptions in kWh
+            chunk_size: Number of consumers scored per broadcast
+            
+        Returns:
+            List of results in the same format as predict_and_analyze, one per consumption
+        """
+        consumptions = np.asarray(consumptions, dtype=np.float64)
+        best_indices = np.empty(len(consumptions), dtype=np.intp)
+        scoring = self.scoring
+        for start in range(0, len(consumptions), chunk_size):
+            chunk = consumptions[start:start + chunk_size]
+            best_indices[start:start + len(chunk)] = np.argmax(self.score_projects(chunk * 12, scoring), axis=1)
+        
+        # Many consumers share a best project, so look each row up only once
+        rows = {idx: self._project_row(idx) for idx in np.unique(best_indices).tolist()}
+        return [
+            self._analyze_project(rows[best_idx], float(monthly_consumption))
+            for best_idx, monthly_consumption in zip(best_indices.tolist(), consumptions)
+        ]
+    
+    def _project_row(self, idx: int) -> Dict[str, Any]:
+        """All columns of one project as a dict"""
+        return self.projects_df.iloc[idx].to_dict()
+    
+    def _analyze_project(self, best_project: Dict[str, Any], monthly_consumption: float) -> Dict[str, Any]:
+        """Build the share and financial breakdown of one project for one consumer"""
+        annual_consumption = monthly_consumption * 12
         
         # Get monthly generation
         monthly_generation = [best_project[f'Month_{i}_Energy_kWh'] for i in range(1, 13)]
@@ -164,6 +434,149 @@ class SolarPredictor:
         
         return results
 
+class _GrowableColumns:
+    """Named 1-D arrays that grow in place with amortised doubling"""
+    
+    def __init__(self, dtypes: Dict[str, Any]):
+        self.size = 0
+        self._arrays = {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+    
+    def append(self, columns: Dict[str, np.ndarray]):
+        count = len(next(iter(columns.values())))
+        capacity = len(next(iter(self._arrays.values())))
+        if self.size + count > capacity:
+            capacity = max(self.size + count, 2 * capacity)
+            for name, array in self._arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self.size] = array[:self.size]
+                self._arrays[name] = grown
+        for name, array in self._arrays.items():
+            array[self.size:self.size + count] = columns[name]
+        self.size += count
+    
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._arrays[name][:self.size]
+
+
+class StreamingSolarPredictor(SolarPredictor):
+    """SolarPredictor that ingests the dataset in chunks and keeps only compact arrays
+    
+    Instead of the full feature table it keeps float32 columns of what scoring
+    and the per-project analysis read, plus category codes for company and
+    location. New installations can be appended without re-reading the dataset;
+    they get the same features they would have had as extra rows of the file.
+    Scores are kept in float32, so near-ties may resolve differently than in
+    SolarPredictor.
+    """
+    
+    # Columns _analyze_project reads besides the scoring arrays
+    detail_columns = ['Panel_Capacity_kW', 'Cost_per_kW', 'Energy_Sale_Rate', 'Total_Cost', 'Annual_Revenue'] + MONTH_COLUMNS
+    
+    def __init__(self, csv_path: str, chunk_size: int = 100_000, seed: Optional[int] = None,
+                 result_cache_size: int = 1024, consumption_precision: int = 0):
+        """Initialize the predictor by streaming the dataset
+        
+        Args:
+            csv_path: Solar installation dataset, CSV or Parquet
+            chunk_size: Rows read and derived at a time
+            seed: Seed for the simulated sale rates and cost factors
+            result_cache_size: Number of best projects predict_and_analyze keeps (LRU)
+            consumption_precision: Decimals monthly consumption is rounded to
+                for predict_and_analyze's cache key only
+        """
+        self.chunk_size = chunk_size
+        # Appends ingest into shared columns, so they run one at a time
+        self._append_lock = threading.Lock()
+        super().__init__(csv_path, use_cache=False, seed=seed, result_cache_size=result_cache_size,
+                         consumption_precision=consumption_precision)
+    
+    def load_data(self, csv_path: str):
+        """Stream the dataset chunk by chunk into the compact columns"""
+        try:
+            self.dataset_version = self._dataset_version(csv_path)
+            with self._results_lock:
+                self._results.clear()
+            
+            self._rng = np.random.default_rng(self.seed)
+            self._location_rates = self._draw_sale_rates(self._rng)
+            self._columns = _GrowableColumns(dict(
+                {name: np.float32 for name in ['annual_energy', 'base_scores', 'roi', 'payback_years'] + self.detail_columns},
+                company=np.int32, location=np.int32
+            ))
+            self._categories = {'company': {}, 'location': {}}
+            
+            for chunk in iter_installation_chunks(csv_path, self.chunk_size):
+                self._ingest(chunk)
+            self._publish()
+        
+        except Exception as e:
+            print(f"Error loading data: {str(e)}")
+            raise
+    
+    def append_installations(self, installations: Union[pd.DataFrame, str]) -> int:
+        """Add installations (a DataFrame or a dataset path) and return how many were added"""
+        chunks = [installations] if isinstance(installations, pd.DataFrame) else iter_installation_chunks(installations, self.chunk_size)
+        with self._append_lock:
+            added = 0
+            digest = hashlib.sha256(self.dataset_version.encode())
+            for chunk in chunks:
+                digest.update(pd.util.hash_pandas_object(chunk, index=False).to_numpy().tobytes())
+                added += self._ingest(chunk.copy())
+            
+            # Publish before the new version is visible, so a result computed from
+            # the old arrays is only ever cached under the old version
+            self._publish()
+            # The appended rows are part of the dataset version that keys cached results
+            self.dataset_version = f"{digest.hexdigest()[:32]}-s{self.seed}"
+            with self._results_lock:
+                self._results.clear()
+        return added
+    
+    def _encode(self, kind: str, values: pd.Series) -> np.ndarray:
+        """Map text values to stable integer codes, adding unseen ones"""
+        codes = self._categories[kind]
+        for value in values.unique():
+            codes.setdefault(value, len(codes))
+        return values.map(codes).to_numpy(dtype=np.int32)
+    
+    def _ingest(self, chunk: pd.DataFrame) -> int:
+        self._derive_features(chunk, self._location_rates, self._rng)
+        columns = self._score_columns(chunk)
+        for name in self.detail_columns:
+            columns[name] = chunk[name].to_numpy()
+        columns['company'] = self._encode('company', chunk['Company'])
+        columns['location'] = self._encode('location', chunk['Location'])
+        self._columns.append(columns)
+        return len(chunk)
+    
+    def _publish(self):
+        """Swap in scoring arrays over the current columns, all in one assignment"""
+        # Names first: every row of the new arrays must already have them
+        self._company_names = list(self._categories['company'])
+        self._location_names = list(self._categories['location'])
+        locations = self._columns['location']
+        self.scoring = _ScoringArrays(
+            annual_energy=self._columns['annual_energy'],
+            base_scores=self._columns['base_scores'],
+            roi=self._columns['roi'],
+            payback_years=self._columns['payback_years'],
+            location_masks={location: locations == code for location, code in self._categories['location'].items()}
+        )
+    
+    def _project_row(self, idx: int) -> Dict[str, Any]:
+        """The columns _analyze_project and calculate_optimal_shares read, for one project"""
+        # Rows are only ever appended, so an index from any published snapshot stays valid
+        scoring = self.scoring
+        row = {name: float(self._columns[name][idx]) for name in self.detail_columns}
+        row.update({
+            'Company': self._company_names[self._columns['company'][idx]],
+            'Location': self._location_names[self._columns['location'][idx]],
+            'Total_Annual_Energy_kWh': float(scoring.annual_energy[idx]),
+            'ROI': float(scoring.roi[idx])
+        })
+        return row
+
+
 def format_and_print_results(results: Dict[str, Any]) -> None:
     """Format and print the analysis results"""
     project = results['project_details']
@@ -198,14 +611,29 @@ def format_and_print_results(results: Dict[str, Any]) -> None:
     ), 1):
         print(f"{month:2d}     |  {gen:10.2f}            |  {per_share:8.2f}        |  ₹{saving:10,.2f}")
 
-# Example usage:
-
-# Initialize the predictor with CSV data
-predictor = SolarPredictor('solar_installation_analysis_monthly.csv')
-
-# Get analysis for a specific monthly consumption
-monthly_consumption = float(input("Enter your monthly consumption in kWh: "))
-results = predictor.predict_and_analyze(monthly_consumption)
+def main(argv=None) -> None:
+    """Command line entry point: recommend a project for one monthly consumption"""
+    parser = argparse.ArgumentParser(description="Recommend a solar project for a monthly consumption")
+    parser.add_argument('--csv', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solar_installation_analysis_monthly.csv'),
+                        help="Solar installation dataset")
+    parser.add_argument('--consumption', type=float, help="Monthly consumption in kWh (prompted if omitted)")
+    parser.add_argument('--chunk-size', type=int, help="Stream the dataset this many rows at a time")
+    args = parser.parse_args(argv)
+    
+    # Initialize the predictor with CSV data
+    if args.chunk_size:
+        predictor = StreamingSolarPredictor(args.csv, chunk_size=args.chunk_size)
+    else:
+        predictor = SolarPredictor(args.csv)
+    
+    # Get analysis for a specific monthly consumption
+    monthly_consumption = args.consumption
+    if monthly_consumption is None:
+        monthly_consumption = float(input("Enter your monthly consumption in kWh: "))
+    results = predictor.predict_and_analyze(monthly_consumption)
+    
+    # Print the results
+    format_and_print_results(results)
 
-# Print the results
-format_and_print_results(results)
+if __name__ == "__main__":
+    main()